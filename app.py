@@ -2,11 +2,15 @@
 Interfaz Streamlit para Automatización de Reportes MP
 """
 import streamlit as st
+import collections
+import itertools
 import logging
+import pandas as pd
 import sys
 import time
 from datetime import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 # Configurar logging para capturar en la UI
 logging.basicConfig(
@@ -19,9 +23,10 @@ logging.basicConfig(
 sys.path.insert(0, str(Path(__file__).parent))
 
 from src.config import get_config, reset_config
-from src.workflow import ReportWorkflow, StepResult
-from src.tableau_client import TableauClient
-from src.sql_client import DEADWHClient
+
+if TYPE_CHECKING:
+    from src.sql_client import DEADWHClient
+    from src.workflow import StepResult
 
 
 # Configuración de la página
@@ -31,71 +36,40 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# CSS personalizado para tema Light
-st.markdown("""
-<style>
-    .success-box {
-        padding: 1rem;
-        border-radius: 0.5rem;
-        background-color: #e8f5e9;
-        border-left: 4px solid #4caf50;
-        margin: 0.5rem 0;
-        color: #1b5e20;
-    }
-    .error-box {
-        padding: 1rem;
-        border-radius: 0.5rem;
-        background-color: #ffebee;
-        border-left: 4px solid #f44336;
-        margin: 0.5rem 0;
-        color: #b71c1c;
-    }
-    .info-box {
-        padding: 1rem;
-        border-radius: 0.5rem;
-        background-color: #e3f2fd;
-        border-left: 4px solid #2196f3;
-        margin: 0.5rem 0;
-        color: #0d47a1;
-    }
-    .step-running {
-        animation: pulse 1.5s infinite;
-    }
-    @keyframes pulse {
-        0%, 100% { opacity: 1; }
-        50% { opacity: 0.5; }
-    }
-    /* Logo DEACERO */
-    .sidebar-logo {
-        filter: none;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Iconos por nivel de log (constante de módulo: no se reconstruye por rerun)
+_LEVEL_ICONS = {
+    'INFO': '🔵',
+    'WARNING': '🟡',
+    'ERROR': '🔴',
+    'DEBUG': '⚪'
+}
 
 
 def init_session_state():
     """Inicializa el estado de la sesión"""
-    if 'logs' not in st.session_state:
-        st.session_state.logs = []
-    if 'running' not in st.session_state:
-        st.session_state.running = False
-    if 'last_result' not in st.session_state:
-        st.session_state.last_result = None
-    if 'steps' not in st.session_state:
-        st.session_state.steps = []
+    ss = st.session_state
+    # Capacidad fija en logs/steps: lo viejo se desecha en O(1) y la memoria queda acotada
+    ss.setdefault('logs', collections.deque(maxlen=200))
+    ss.setdefault('last_result', None)
+    ss.setdefault('steps', collections.deque(maxlen=100))
 
 
 def add_log(message: str, level: str = "INFO"):
     """Agrega un mensaje al log"""
-    timestamp = datetime.now().strftime("%H:%M:%S")
+    # El timestamp se formatea una vez por segundo: las ráfagas de logs
+    # dentro del mismo segundo reutilizan la cadena ya formateada
+    now_sec = int(time.time())
+    if getattr(add_log, "_last_sec", None) != now_sec:
+        add_log._last_ts = time.strftime("%H:%M:%S", time.localtime(now_sec))
+        add_log._last_sec = now_sec
     st.session_state.logs.append({
-        'timestamp': timestamp,
+        'timestamp': add_log._last_ts,
         'level': level,
         'message': message
     })
 
 
-def on_step_complete(result: StepResult):
+def on_step_complete(result: "StepResult"):
     """Callback cuando se completa un paso"""
     st.session_state.steps.append(result)
     level = "INFO" if result.success else "ERROR"
@@ -103,6 +77,40 @@ def on_step_complete(result: StepResult):
     add_log(f"{icon} {result.nombre}: {result.mensaje}", level)
 
 
+@st.cache_resource
+def get_deadwh_client() -> "DEADWHClient":
+    """Obtiene el cliente DEADWH compartido entre reruns (una conexión por worker)"""
+    from src.sql_client import DEADWHClient
+    return DEADWHClient()
+
+
+@st.cache_data(ttl=300)
+def _load_reportes():
+    """Carga la configuración de reportes desde DEADWH (cacheada 5 min)"""
+    reportes = get_deadwh_client().obtener_configuracion_reportes()
+    return pd.DataFrame(reportes)
+
+
+@st.cache_data(ttl=300)
+def _load_destinatarios():
+    """Deriva los destinatarios únicos de la configuración ya cacheada (sin SQL extra)"""
+    df_reportes = _load_reportes()
+    if df_reportes.empty:
+        return []
+
+    correos = set()
+    for col in ('Para', 'CC', 'BCC', 'CorreoPrueba'):
+        if col not in df_reportes.columns:
+            continue
+        for valor in df_reportes[col].dropna():
+            # Dividir por ; o , y limpiar espacios (mismo criterio que el cliente SQL)
+            correos.update(
+                c.strip() for c in str(valor).replace(';', ',').split(',')
+                if c.strip() and '@' in c
+            )
+    return sorted(correos)
+
+
 def render_sidebar():
     """Renderiza la barra lateral"""
     with st.sidebar:
@@ -111,11 +119,14 @@ def render_sidebar():
         # Botón para recargar configuración
         if st.button("🔄 Recargar Configuración", use_container_width=True, type="secondary"):
             reset_config()
+            st.session_state.pop("config_validation", None)
             st.rerun()
-        
-        # Estado de configuración
+
+        # Estado de configuración (validación cacheada: el .env no cambia entre reruns)
         config = get_config()
-        is_valid, errors = config.validate()
+        if "config_validation" not in st.session_state:
+            st.session_state.config_validation = (config.validate(), config.validate_jira())
+        (is_valid, errors), (jira_valid, _) = st.session_state.config_validation
         
         if is_valid:
             st.success("✅ Configuración válida")
@@ -136,7 +147,6 @@ def render_sidebar():
             st.metric("SQL Server", "Conectado" if config.sql_infocentral.password else "❌")
         
         # Jira
-        jira_valid, _ = config.validate_jira()
         st.metric("Jira", "Conectado" if jira_valid else "⚠️ Opcional")
         
         st.divider()
@@ -158,43 +168,51 @@ def render_sidebar():
                 st.warning("⚠️ No configurado")
         
         with st.expander("📊 Reportes PDF - Destinatarios", expanded=False):
-            try:
-                deadwh = DEADWHClient()
-                reportes = deadwh.obtener_configuracion_reportes()
-                
-                if reportes:
-                    st.write(f"**Total de reportes configurados:** {len(reportes)}")
-                    
-                    # Mostrar tabla de reportes
-                    import pandas as pd
-                    df_reportes = pd.DataFrame(reportes)
-                    st.dataframe(
-                        df_reportes[['ClaReporte', 'NombreReporte', 'Para', 'CC', 'CorreoPrueba']],
-                        use_container_width=True,
-                        hide_index=True
-                    )
-                    
-                    # Mostrar todos los destinatarios únicos
-                    destinatarios = deadwh.obtener_todos_destinatarios()
-                    if destinatarios:
-                        st.write(f"**Destinatarios únicos:** {len(destinatarios)}")
-                        st.text(", ".join(destinatarios[:10]))  # Mostrar primeros 10
-                        if len(destinatarios) > 10:
-                            st.caption(f"... y {len(destinatarios) - 10} más")
-                else:
-                    st.info("No se pudo obtener la configuración de reportes")
-            except Exception as e:
-                st.error(f"Error obteniendo configuración: {str(e)}")
-                st.caption("💡 Verifica la conexión a SQL Server (DEADWH)")
-        
+            # Carga perezosa: no consultar SQL hasta que el usuario lo pida
+            if st.button("📥 Cargar destinatarios", use_container_width=True):
+                st.session_state.reportes_loaded = True
+
+            if st.session_state.get("reportes_loaded"):
+                _render_reportes_info()
+
         st.divider()
-        
+
         # Información
         st.subheader("ℹ️ Información")
         st.text(f"Datasource: {config.tableau.datasource_name}")
         st.text(f"Proyecto Jira: {config.jira.project_key}")
 
 
+@st.fragment
+def _render_reportes_info():
+    """Muestra la configuración de reportes y destinatarios (requiere SQL)"""
+    try:
+        df_reportes = _load_reportes()
+
+        if not df_reportes.empty:
+            st.write(f"**Total de reportes configurados:** {len(df_reportes)}")
+
+            # Mostrar tabla de reportes
+            st.dataframe(
+                df_reportes[['ClaReporte', 'NombreReporte', 'Para', 'CC', 'CorreoPrueba']],
+                use_container_width=True,
+                hide_index=True
+            )
+
+            # Mostrar todos los destinatarios únicos
+            destinatarios = _load_destinatarios()
+            if destinatarios:
+                st.write(f"**Destinatarios únicos:** {len(destinatarios)}")
+                st.text(", ".join(destinatarios[:10]))  # Mostrar primeros 10
+                if len(destinatarios) > 10:
+                    st.caption(f"... y {len(destinatarios) - 10} más")
+        else:
+            st.info("No se pudo obtener la configuración de reportes")
+    except Exception as e:
+        st.error(f"Error obteniendo configuración: {str(e)}")
+        st.caption("💡 Verifica la conexión a SQL Server (DEADWH)")
+
+
 def render_header():
     """Renderiza el encabezado"""
     col1, col2, col3 = st.columns([2, 1, 1])
@@ -204,11 +222,9 @@ def render_header():
         st.caption("Sistema de validación y envío de reportes de Materias Primas")
     
     with col3:
-        st.metric(
-            "Estado",
-            "🟢 Listo" if not st.session_state.running else "🔄 Ejecutando",
-            delta=None
-        )
+        # Las acciones corren de forma síncrona dentro del handler del botón,
+        # así que al repintarse el encabezado siempre hay un estado en reposo
+        st.metric("Estado", "🟢 Listo", delta=None)
 
 
 def render_actions():
@@ -220,7 +236,6 @@ def render_actions():
     with col1:
         if st.button(
             "🔍 Validar Extracto",
-            disabled=st.session_state.running,
             use_container_width=True,
             type="secondary"
         ):
@@ -229,7 +244,6 @@ def render_actions():
     with col2:
         if st.button(
             "🚀 Proceso Completo",
-            disabled=st.session_state.running,
             use_container_width=True,
             type="primary"
         ):
@@ -238,7 +252,6 @@ def render_actions():
     with col3:
         if st.button(
             "📧 Solo Enviar Correos",
-            disabled=st.session_state.running,
             use_container_width=True,
             type="secondary"
         ):
@@ -247,100 +260,65 @@ def render_actions():
     with col4:
         if st.button(
             "🗑️ Limpiar Logs",
-            disabled=st.session_state.running,
             use_container_width=True
         ):
-            st.session_state.logs = []
-            st.session_state.steps = []
+            st.session_state.logs.clear()
+            st.session_state.steps.clear()
             st.session_state.last_result = None
             st.rerun()
 
 
+def _run_with_status(label, metodo, ok_msg, fail_msg):
+    """Ejecuta un método del workflow dentro de un st.status con progreso incremental"""
+    st.session_state.steps.clear()
+    add_log(f"{label}...", "INFO")
+
+    with st.status(f"{label}...", expanded=True) as status:
+        def _cb(result):
+            icon = "✅" if result.success else "❌"
+            status.write(f"{icon} {result.nombre}: {result.mensaje} ({result.duracion:.2f}s)")
+            on_step_complete(result)
+
+        try:
+            from src.workflow import ReportWorkflow
+            workflow = ReportWorkflow(on_step_complete=_cb)
+            success, message = getattr(workflow, metodo)()
+
+            st.session_state.last_result = {
+                'success': success,
+                'message': message,
+                'summary': workflow.get_summary()
+            }
+
+            if success:
+                add_log(f"✅ {ok_msg}: {message}", "INFO")
+            else:
+                add_log(f"❌ {fail_msg}: {message}", "ERROR")
+
+            status.update(label=message, state="complete" if success else "error")
+
+        except Exception as e:
+            add_log(f"❌ Error: {str(e)}", "ERROR")
+            st.session_state.last_result = {'success': False, 'message': str(e)}
+            status.update(label=str(e), state="error")
+
+
 def run_validation():
     """Ejecuta solo la validación"""
-    st.session_state.running = True
-    st.session_state.steps = []
-    add_log("Iniciando validación de extracto...", "INFO")
-    
-    try:
-        workflow = ReportWorkflow(on_step_complete=on_step_complete)
-        success, message = workflow.run_validation_only()
-        
-        st.session_state.last_result = {
-            'success': success,
-            'message': message,
-            'summary': workflow.get_summary()
-        }
-        
-        if success:
-            add_log(f"✅ Validación exitosa: {message}", "INFO")
-        else:
-            add_log(f"❌ Validación fallida: {message}", "ERROR")
-            
-    except Exception as e:
-        add_log(f"❌ Error: {str(e)}", "ERROR")
-        st.session_state.last_result = {'success': False, 'message': str(e)}
-    finally:
-        st.session_state.running = False
-        st.rerun()
+    _run_with_status("Iniciando validación de extracto", "run_validation_only",
+                     "Validación exitosa", "Validación fallida")
 
 
 def run_full_workflow():
     """Ejecuta el flujo completo"""
-    st.session_state.running = True
-    st.session_state.steps = []
-    add_log("Iniciando proceso completo...", "INFO")
-    
-    try:
-        workflow = ReportWorkflow(on_step_complete=on_step_complete)
-        success, message = workflow.run_full()
-        
-        st.session_state.last_result = {
-            'success': success,
-            'message': message,
-            'summary': workflow.get_summary()
-        }
-        
-        if success:
-            add_log(f"✅ Proceso completado: {message}", "INFO")
-        else:
-            add_log(f"❌ Proceso fallido: {message}", "ERROR")
-            
-    except Exception as e:
-        add_log(f"❌ Error: {str(e)}", "ERROR")
-        st.session_state.last_result = {'success': False, 'message': str(e)}
-    finally:
-        st.session_state.running = False
-        st.rerun()
+    _run_with_status("Iniciando proceso completo", "run_full",
+                     "Proceso completado", "Proceso fallido")
 
 
 def run_send_only():
     """Ejecuta solo el envío de correos"""
-    st.session_state.running = True
-    st.session_state.steps = []
-    add_log("Iniciando envío de correos...", "INFO")
-    
-    try:
-        workflow = ReportWorkflow(on_step_complete=on_step_complete)
-        success, message = workflow.run_send_only()
-        
-        st.session_state.last_result = {
-            'success': success,
-            'message': message,
-            'summary': workflow.get_summary()
-        }
-        
-        if success:
-            add_log(f"✅ Envío exitoso: {message}", "INFO")
-        else:
-            add_log(f"❌ Envío fallido: {message}", "ERROR")
-            
-    except Exception as e:
-        add_log(f"❌ Error: {str(e)}", "ERROR")
-        st.session_state.last_result = {'success': False, 'message': str(e)}
-    finally:
-        st.session_state.running = False
-        st.rerun()
+    _run_with_status("Iniciando envío de correos", "run_send_only",
+                     "Envío exitoso", "Envío fallido")
 
 
 def render_status():
@@ -378,12 +356,24 @@ def render_steps():
     """Renderiza los pasos ejecutados"""
     if st.session_state.steps:
         st.subheader("Pasos Ejecutados")
-        
+
+        # Tabla única para el caso común (éxito + tiempos): 1 elemento en vez de N expanders
+        rows = [
+            {
+                'Paso': f"{'✅' if step.success else '❌'} {step.nombre}",
+                'Estado': step.mensaje,
+                'Duración': f"{step.duracion:.2f}s"
+            }
+            for step in st.session_state.steps
+        ]
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+
+        # Solo los pasos fallidos ameritan el detalle expandido
         for step in st.session_state.steps:
-            icon = "✅" if step.success else "❌"
-            color = "green" if step.success else "red"
-            
-            with st.expander(f"{icon} {step.nombre} ({step.duracion:.2f}s)", expanded=not step.success):
+            if step.success:
+                continue
+
+            with st.expander(f"❌ {step.nombre} ({step.duracion:.2f}s)", expanded=True):
                 st.write(f"**Estado:** {step.mensaje}")
                 if step.detalles:
                     # Mostrar información de fecha de actualización de forma más clara
@@ -400,14 +390,15 @@ def render_steps():
                                 st.info(f"🌐 UTC: {step.detalles['last_updated_utc']}")
                             if 'timezone' in step.detalles:
                                 st.caption(f"Zona horaria: {step.detalles['timezone']}")
-                    
+
                     # Mostrar otros detalles que no sean de fecha
-                    otros_detalles = {k: v for k, v in step.detalles.items() 
+                    otros_detalles = {k: v for k, v in step.detalles.items()
                                     if k not in ['last_updated', 'last_updated_utc', 'last_updated_local', 'timezone']}
                     if otros_detalles:
                         st.json(otros_detalles)
 
 
+@st.fragment
 def render_logs():
     """Renderiza los logs"""
     st.subheader("Logs")
@@ -416,16 +407,12 @@ def render_logs():
     
     with log_container:
         if st.session_state.logs:
-            # Mostrar logs en orden inverso (más reciente primero)
-            for log in reversed(st.session_state.logs[-50:]):  # Últimos 50 logs
-                level_colors = {
-                    'INFO': '🔵',
-                    'WARNING': '🟡',
-                    'ERROR': '🔴',
-                    'DEBUG': '⚪'
-                }
-                icon = level_colors.get(log['level'], '⚪')
-                st.text(f"{log['timestamp']} {icon} {log['message']}")
+            # Mostrar logs en orden inverso (más reciente primero) en un solo elemento
+            lines = [
+                f"{log['timestamp']} {_LEVEL_ICONS.get(log['level'], '⚪')} {log['message']}"
+                for log in itertools.islice(reversed(st.session_state.logs), 50)
+            ]
+            st.code("\n".join(lines), language=None)
         else:
             st.info("No hay logs disponibles. Ejecuta una acción para ver los resultados.")
 
@@ -9,27 +9,33 @@ Uso:
     python run_workflow.py --send --reporte 5  # Envía solo reporte específico
 """
 import argparse
+import functools
 import logging
 import sys
 from datetime import datetime
 from pathlib import Path
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s [%(name)s] %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(
-            Path(__file__).parent / 'logs' / f'workflow_{datetime.now().strftime("%Y%m%d")}.log',
-            encoding='utf-8'
-        )
-    ]
-)
-
 logger = logging.getLogger(__name__)
 
+
+def setup_logging(quiet: bool = False):
+    """Configura logging a consola y archivo (crea el directorio de logs primero)"""
+    logs_dir = Path(__file__).parent / 'logs'
+    logs_dir.mkdir(exist_ok=True)
+
+    logging.basicConfig(
+        level=logging.WARNING if quiet else logging.INFO,
+        format='%(asctime)s %(levelname)s [%(name)s] %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=[
+            logging.StreamHandler(sys.stdout),
+            logging.FileHandler(
+                logs_dir / f'workflow_{datetime.now().strftime("%Y%m%d")}.log',
+                encoding='utf-8'
+            )
+        ]
+    )
+
 # Agregar src al path
 sys.path.insert(0, str(Path(__file__).parent))
 
@@ -39,38 +45,40 @@ from src.workflow import ReportWorkflow, StepResult
 
 def print_banner():
     """Imprime el banner de inicio"""
-    print("""
+    sys.stdout.write("""
 ================================================================
        AUTOMATIZACION DE REPORTES MP - DEACERO                
                                                               
   Sistema de validacion y envio de reportes de Materias Primas
 ================================================================
-    """)
+    \n""")
 
 
 def print_result(success: bool, message: str, summary: dict = None):
     """Imprime el resultado de la ejecución"""
-    print("\n" + "=" * 60)
+    lines = ["", "=" * 60]
     
     if success:
-        print("[OK] PROCESO COMPLETADO EXITOSAMENTE")
+        lines.append("[OK] PROCESO COMPLETADO EXITOSAMENTE")
     else:
-        print("[ERROR] PROCESO FALLIDO")
+        lines.append("[ERROR] PROCESO FALLIDO")
     
-    print(f"   {message}")
+    lines.append(f"   {message}")
     
     if summary:
-        print(f"\nResumen:")
-        print(f"   - Pasos ejecutados: {summary.get('total_pasos', 0)}")
-        print(f"   - Exitosos: {summary.get('pasos_exitosos', 0)}")
-        print(f"   - Fallidos: {summary.get('pasos_fallidos', 0)}")
-        print(f"   - Tiempo total: {summary.get('tiempo_total', 0):.2f}s")
+        lines.append("\nResumen:")
+        lines.append(f"   - Pasos ejecutados: {summary.get('total_pasos', 0)}")
+        lines.append(f"   - Exitosos: {summary.get('pasos_exitosos', 0)}")
+        lines.append(f"   - Fallidos: {summary.get('pasos_fallidos', 0)}")
+        lines.append(f"   - Tiempo total: {summary.get('tiempo_total', 0):.2f}s")
         
         if summary.get('ticket_jira'):
             config = get_config()
-            print(f"   - Ticket Jira: {config.jira.server}/browse/{summary['ticket_jira']}")
+            lines.append(f"   - Ticket Jira: {config.jira.server}/browse/{summary['ticket_jira']}")
     
-    print("=" * 60 + "\n")
+    lines.append("=" * 60 + "\n")
+    # Una sola escritura: un solo lock de stdout y un solo flush
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 def on_step_complete(result: StepResult):
@@ -79,8 +87,9 @@ def on_step_complete(result: StepResult):
     print(f"  {icon} {result.nombre}: {result.mensaje} ({result.duracion:.2f}s)")
 
 
+@functools.lru_cache(maxsize=1)
 def validate_config() -> bool:
-    """Valida la configuración antes de ejecutar"""
+    """Valida la configuración antes de ejecutar (resultado memoizado)"""
     config = get_config()
     is_valid, errors = config.validate()
     
@@ -161,9 +170,8 @@ Ejemplos:
     
     args = parser.parse_args()
     
-    # Configurar nivel de logging
-    if args.quiet:
-        logging.getLogger().setLevel(logging.WARNING)
+    # Configurar logging (crea el directorio de logs si no existe)
+    setup_logging(quiet=args.quiet)
     
     print_banner()
     
@@ -171,10 +179,6 @@ Ejemplos:
     if not validate_config():
         return 1
     
-    # Crear directorio de logs si no existe
-    logs_dir = Path(__file__).parent / 'logs'
-    logs_dir.mkdir(exist_ok=True)
-    
     # Ejecutar acción
     try:
         if args.full:
@@ -8,16 +8,17 @@ from typing import Optional
 from dotenv import load_dotenv
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class TableauConfig:
     server: str
     user: str
     password: str
     site: str
     datasource_name: str
+    ca_bundle: str = ""  # ruta a un bundle CA; vacío = sin verificación TLS
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class SQLServerConfig:
     server: str
     user: str
@@ -25,15 +26,16 @@ class SQLServerConfig:
     database: str = ""
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class JiraConfig:
     server: str
     user: str
     api_token: str
     project_key: str
+    auth_method: str = "basic"  # 'basic' (Cloud user+token) o 'pat' (bearer)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class EmailConfig:
     server: str
     user: str
@@ -44,13 +46,13 @@ class EmailConfig:
     success_recipients: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class PathsConfig:
     pdf_source: str
     pdf_dest: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ValidationConfig:
     max_extract_age_hours: float
     max_refresh_retries: int
@@ -66,67 +68,72 @@ class Config:
         env_path = pathlib.Path(__file__).parent.parent / '.env'
         load_dotenv(dotenv_path=env_path)
         
+        # Snapshot local del entorno: un solo acceso a os.environ para todas las lecturas
+        env = os.environ
+        
         # Tableau
         self.tableau = TableauConfig(
-            server=os.getenv("TABLEAU_SERVER", "https://tableau.deacero.com/"),
-            user=os.getenv("TABLEAU_USER", ""),
-            password=os.getenv("TABLEAU_PASSWORD", ""),
-            site=os.getenv("TABLEAU_SITE", ""),
-            datasource_name=os.getenv("TABLEAU_DATASOURCE_NAME", "Datamart Materias Primas")
+            server=env.get("TABLEAU_SERVER", "https://tableau.deacero.com/"),
+            user=env.get("TABLEAU_USER", ""),
+            password=env.get("TABLEAU_PASSWORD", ""),
+            site=env.get("TABLEAU_SITE", ""),
+            datasource_name=env.get("TABLEAU_DATASOURCE_NAME", "Datamart Materias Primas"),
+            ca_bundle=env.get("TABLEAU_CA_BUNDLE", "")
         )
         
         # SQL Servers
         self.sql_infocentral = SQLServerConfig(
-            server=os.getenv("SQL_INFOCENTRAL_SERVER", "INFOCENTRAL"),
-            user=os.getenv("SQL_INFOCENTRAL_USER", "sa"),
-            password=os.getenv("SQL_INFOCENTRAL_PWD", ""),
+            server=env.get("SQL_INFOCENTRAL_SERVER", "INFOCENTRAL"),
+            user=env.get("SQL_INFOCENTRAL_USER", "sa"),
+            password=env.get("SQL_INFOCENTRAL_PWD", ""),
             database="InfoCentral"
         )
         
         self.sql_deadwh = SQLServerConfig(
-            server=os.getenv("SQL_DEADWH_SERVER", "DEADWH"),
-            user=os.getenv("SQL_DEADWH_USER", "sa"),
-            password=os.getenv("SQL_DEADWH_PWD", ""),
+            server=env.get("SQL_DEADWH_SERVER", "DEADWH"),
+            user=env.get("SQL_DEADWH_USER", "sa"),
+            password=env.get("SQL_DEADWH_PWD", ""),
             database="TIMonitorSQL"
         )
         
         self.sql_cubosofi = SQLServerConfig(
-            server=os.getenv("SQL_CUBOSOFI_SERVER", "SrvCubosOfi"),
-            user=os.getenv("SQL_CUBOSOFI_USER", "artus"),
-            password=os.getenv("SQL_CUBOSOFI_PWD", ""),
+            server=env.get("SQL_CUBOSOFI_SERVER", "SrvCubosOfi"),
+            user=env.get("SQL_CUBOSOFI_USER", "artus"),
+            password=env.get("SQL_CUBOSOFI_PWD", ""),
             database="msdb"
         )
         
         # Email
         self.email = EmailConfig(
-            server=os.getenv("SQL_EMAIL_SERVER", "SRVMODMEM.gpodeacero.corp"),
-            user=os.getenv("SQL_EMAIL_USER", "TYDUsr"),
-            password=os.getenv("SQL_EMAIL_PWD", ""),
-            database=os.getenv("SQL_EMAIL_DATABASE", "MEM"),
-            profile=os.getenv("SQL_EMAIL_PROFILE", "MEM_Profile"),
-            error_recipients=os.getenv("ERROR_EMAIL_TO", ""),
-            success_recipients=os.getenv("SUCCESS_EMAIL_TO", "")
+            server=env.get("SQL_EMAIL_SERVER", "SRVMODMEM.gpodeacero.corp"),
+            user=env.get("SQL_EMAIL_USER", "TYDUsr"),
+            password=env.get("SQL_EMAIL_PWD", ""),
+            database=env.get("SQL_EMAIL_DATABASE", "MEM"),
+            profile=env.get("SQL_EMAIL_PROFILE", "MEM_Profile"),
+            error_recipients=env.get("ERROR_EMAIL_TO", ""),
+            success_recipients=env.get("SUCCESS_EMAIL_TO", "")
         )
         
         # Jira
         self.jira = JiraConfig(
-            server=os.getenv("JIRA_SERVER", "https://deacero.atlassian.net"),
-            user=os.getenv("JIRA_USER", ""),
-            api_token=os.getenv("JIRA_API_TOKEN", ""),
-            project_key=os.getenv("JIRA_PROJECT_KEY", "DDF")
+            server=env.get("JIRA_SERVER", "https://deacero.atlassian.net"),
+            user=env.get("JIRA_USER", ""),
+            api_token=env.get("JIRA_API_TOKEN", ""),
+            project_key=env.get("JIRA_PROJECT_KEY", "DDF"),
+            auth_method=env.get("JIRA_AUTH_METHOD", "basic")
         )
         
         # Paths
         self.paths = PathsConfig(
-            pdf_source=os.getenv("PDF_SOURCE_PATH", "C:/pythonPrograms/Reportes MP/Reportes/"),
-            pdf_dest=os.getenv("PDF_DEST_PATH", "//DEADWH/ReportesMateriasPrimas/")
+            pdf_source=env.get("PDF_SOURCE_PATH", "C:/pythonPrograms/Reportes MP/Reportes/"),
+            pdf_dest=env.get("PDF_DEST_PATH", "//DEADWH/ReportesMateriasPrimas/")
         )
         
         # Validation
         self.validation = ValidationConfig(
-            max_extract_age_hours=float(os.getenv("MAX_EXTRACT_AGE_HOURS", "24")),
-            max_refresh_retries=int(os.getenv("MAX_REFRESH_RETRIES", "3")),
-            refresh_wait_seconds=int(os.getenv("REFRESH_WAIT_SECONDS", "60"))
+            max_extract_age_hours=float(env.get("MAX_EXTRACT_AGE_HOURS", "24")),
+            max_refresh_retries=int(env.get("MAX_REFRESH_RETRIES", "3")),
+            refresh_wait_seconds=int(env.get("REFRESH_WAIT_SECONDS", "60"))
         )
     
     def validate(self) -> tuple[bool, list[str]]:
@@ -159,10 +166,32 @@ class Config:
 # Singleton
 _config: Optional[Config] = None
 
+# Builder cacheado por Streamlit (se crea solo si la app corre bajo Streamlit)
+_streamlit_builder = None
+
+
+def _get_streamlit_builder():
+    """Crea (una sola vez) el builder de Config cacheado con st.cache_resource"""
+    global _streamlit_builder
+    if _streamlit_builder is None:
+        import streamlit as st
+
+        @st.cache_resource
+        def _build_config() -> Config:
+            return Config()
+
+        _streamlit_builder = _build_config
+    return _streamlit_builder
+
 
 def get_config() -> Config:
     """Obtiene la instancia de configuración (singleton)"""
     global _config
+    if "streamlit" in sys.modules:
+        try:
+            return _get_streamlit_builder()()
+        except ImportError:
+            pass  # Streamlit no disponible realmente, usar singleton normal
     if _config is None:
         _config = Config()
     return _config
@@ -172,3 +201,5 @@ def reset_config():
     """Resetea el singleton de configuración para forzar recarga"""
     global _config
     _config = None
+    if _streamlit_builder is not None:
+        _streamlit_builder.clear()
@@ -2,6 +2,12 @@
 Cliente Jira - Creación automática de tickets
 """
 import logging
+import shelve
+import string
+import tempfile
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
 from typing import Optional
 from datetime import datetime
 
@@ -9,23 +15,112 @@ from .config import get_config
 
 logger = logging.getLogger(__name__)
 
+# Caché en disco de metadatos del proyecto (issuetypes/prioridades) para
+# evitar round-trips repetidos entre ejecuciones del script
+_METADATA_CACHE = str(Path(tempfile.gettempdir()) / "mp_jira_metadata")
+_METADATA_TTL_SECONDS = 86400   # 1 día
+
+
+def _now_iso() -> str:
+    """Timestamp 'YYYY-MM-DD HH:MM:SS' (isoformat es más barato que strftime)"""
+    return datetime.now().isoformat(sep=' ', timespec='seconds')
+
+# Cuerpos de ticket precompilados una sola vez por proceso (ver Notifier,
+# que hace lo mismo con sus plantillas HTML)
+_DESC_ERROR_TMPL = string.Template("""
+h2. Error en Automatización de Reportes MP
+
+*Fecha/Hora:* ${fecha}
+*Componente:* ${componente}
+
+h3. Descripción del Error
+${descripcion}
+
+h3. Acciones Recomendadas
+# Verificar estado del extracto en Tableau Server
+# Revisar logs del proceso de automatización
+# Contactar al equipo de Datos si persiste
+
+----
+_Ticket generado automáticamente por el sistema de automatización de reportes MP_
+            """)
+
+_DESC_EXTRACTO_TMPL = string.Template("""
+El sistema de automatización detectó un problema con el extracto de Tableau.
+
+*Datasource:* ${datasource}
+*Error:* ${error}
+
+El proceso de envío de reportes MP no pudo completarse debido a este error.
+        """)
+
+_DESC_ENVIO_TMPL = string.Template("""
+El sistema de automatización no pudo enviar los reportes de Materias Primas.
+
+*Error:* ${error}
+
+Se requiere intervención manual para completar el envío.
+        """)
+
+_DESC_DATOS_TMPL = string.Template("""
+El sistema detectó diferencias significativas en los datos de inventario.
+
+*Ubicaciones afectadas:*
+${ubicaciones}
+
+Los jobs correctivos fueron ejecutados pero el problema persiste.
+        """)
+
 
 class JiraClient:
     """Cliente para crear tickets en Jira"""
-    
+
     def __init__(self):
         self.config = get_config().jira
         self._client = None
-    
+        # Un solo worker: los tickets se crean en segundo plano mientras el
+        # flujo principal sigue con el correo; el orden de creación se conserva
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        # Validar una sola vez al construir: una config incompleta se detecta
+        # al inicio del proceso y cada crear_ticket_* corta en una lectura
+        self._enabled, self._validation_errors = get_config().validate_jira()
+        if not self._enabled:
+            logger.warning(
+                f"Jira deshabilitado: {', '.join(self._validation_errors)}")
+
+    def invalidate_config_cache(self):
+        """Revalida la configuración (llamar tras recargarla)"""
+        self._enabled, self._validation_errors = get_config().validate_jira()
+
     def _get_client(self):
         """Obtiene el cliente de Jira (lazy loading)"""
         if self._client is None:
             try:
                 from jira import JIRA
-                self._client = JIRA(
-                    server=self.config.server,
-                    basic_auth=(self.config.user, self.config.api_token)
+                from requests.adapters import HTTPAdapter, Retry
+
+                # validate=False + get_server_info=False: la construcción es
+                # puramente local, sin round-trips a serverInfo/myself
+                kwargs = dict(
+                    get_server_info=False,
+                    validate=False,
+                    max_retries=1,
+                    options={'rest_api_version': '2'},
                 )
+                if self.config.auth_method == 'pat':
+                    # PAT bearer (Jira self-hosted / Data Center)
+                    kwargs['token_auth'] = self.config.api_token
+                else:
+                    kwargs['basic_auth'] = (self.config.user, self.config.api_token)
+                self._client = JIRA(server=self.config.server, **kwargs)
+                # Keep-alive con pooling y reintentos sobre la sesión interna:
+                # el handshake TCP+TLS se paga una vez por proceso
+                self._client._session.mount('https://', HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=4,
+                    max_retries=Retry(total=3, backoff_factor=0.3,
+                                      status_forcelist=[502, 503, 504])
+                ))
                 logger.info(f"Conectado a Jira: {self.config.server}")
             except ImportError:
                 logger.error("Librería 'jira' no instalada. Ejecuta: pip install jira")
@@ -34,6 +129,24 @@ class JiraClient:
                 logger.error(f"Error conectando a Jira: {e}")
                 raise
         return self._client
+
+    def _get_metadata_ids(self, client) -> dict:
+        """IDs de issuetypes y prioridades, memoizados en disco con TTL de 1 día"""
+        try:
+            with shelve.open(_METADATA_CACHE) as db:
+                entry = db.get(self.config.project_key)
+                if entry and time.time() - entry['timestamp'] < _METADATA_TTL_SECONDS:
+                    return entry['ids']
+
+                ids = {
+                    'issuetypes': {it.name: it.id for it in client.issue_types()},
+                    'priorities': {p.name: p.id for p in client.priorities()},
+                }
+                db[self.config.project_key] = {'ids': ids, 'timestamp': time.time()}
+                return ids
+        except Exception as e:
+            logger.debug(f"No se pudo usar el caché de metadatos de Jira: {e}")
+            return {'issuetypes': {}, 'priorities': {}}
     
     def crear_ticket_error(self, 
                           titulo: str,
@@ -52,11 +165,9 @@ class JiraClient:
         Returns:
             tuple: (success: bool, message: str, issue_key: str or None)
         """
-        # Validar configuración
-        is_valid, errors = get_config().validate_jira()
-        if not is_valid:
-            msg = f"Configuración de Jira incompleta: {', '.join(errors)}"
-            logger.warning(msg)
+        # Validado una sola vez en __init__
+        if not self._enabled:
+            msg = f"Configuración de Jira incompleta: {', '.join(self._validation_errors)}"
             return (False, msg, None)
         
         logger.info(f"Creando ticket en Jira: {titulo[:50]}...")
@@ -65,40 +176,33 @@ class JiraClient:
             client = self._get_client()
             
             # Construir descripción enriquecida
-            descripcion_completa = f"""
-h2. Error en Automatización de Reportes MP
-
-*Fecha/Hora:* {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-*Componente:* {componente}
-
-h3. Descripción del Error
-{descripcion}
-
-h3. Acciones Recomendadas
-# Verificar estado del extracto en Tableau Server
-# Revisar logs del proceso de automatización
-# Contactar al equipo de Datos si persiste
-
-----
-_Ticket generado automáticamente por el sistema de automatización de reportes MP_
-            """
+            descripcion_completa = _DESC_ERROR_TMPL.substitute(
+                fecha=_now_iso(),
+                componente=componente,
+                descripcion=descripcion
+            )
             
+            # Pasar IDs cacheados (si están) evita que Jira resuelva por nombre
+            metadata = self._get_metadata_ids(client)
+            issuetype_id = metadata['issuetypes'].get('Task')
+            priority_id = metadata['priorities'].get(prioridad)
+
             # Crear el ticket
             issue_dict = {
                 'project': {'key': self.config.project_key},
                 'summary': titulo,
                 'description': descripcion_completa,
-                'issuetype': {'name': 'Task'},  # o 'Bug' según preferencia
+                'issuetype': {'id': issuetype_id} if issuetype_id else {'name': 'Task'},
             }
-            
+
             # Intentar agregar prioridad si está disponible
             try:
-                issue_dict['priority'] = {'name': prioridad}
+                issue_dict['priority'] = {'id': priority_id} if priority_id else {'name': prioridad}
             except Exception:
                 pass  # Algunos proyectos no tienen prioridades configuradas
-            
+
             new_issue = client.create_issue(fields=issue_dict)
-            
+
             issue_key = new_issue.key
             issue_url = f"{self.config.server}/browse/{issue_key}"
             
@@ -110,46 +214,46 @@ _Ticket generado automáticamente por el sistema de automatización de reportes
             logger.error(error_msg)
             return (False, error_msg, None)
     
+    def crear_ticket_error_async(self,
+                                 titulo: str,
+                                 descripcion: str,
+                                 componente: str = "Reportes MP",
+                                 prioridad: str = "High") -> Future:
+        """
+        Versión asíncrona de crear_ticket_error: el POST a Jira corre en un
+        hilo de fondo para solaparse con el envío de correos/SQL.
+
+        Returns:
+            Future que resuelve a (success, message, issue_key)
+        """
+        return self._executor.submit(
+            self.crear_ticket_error, titulo, descripcion, componente, prioridad
+        )
+
     def crear_ticket_extracto_fallido(self, datasource_name: str, 
                                       error_detail: str) -> tuple[bool, str, Optional[str]]:
         """Crea un ticket específico para fallo de extracto"""
         titulo = f"[AUTO] Error en extracto Tableau: {datasource_name}"
-        descripcion = f"""
-El sistema de automatización detectó un problema con el extracto de Tableau.
-
-*Datasource:* {datasource_name}
-*Error:* {error_detail}
-
-El proceso de envío de reportes MP no pudo completarse debido a este error.
-        """
+        descripcion = _DESC_EXTRACTO_TMPL.substitute(
+            datasource=datasource_name, error=error_detail)
         return self.crear_ticket_error(titulo, descripcion, "Extracto Tableau", "High")
     
     def crear_ticket_envio_fallido(self, error_detail: str) -> tuple[bool, str, Optional[str]]:
         """Crea un ticket específico para fallo de envío"""
         titulo = f"[AUTO] Error en envío de reportes MP"
-        descripcion = f"""
-El sistema de automatización no pudo enviar los reportes de Materias Primas.
-
-*Error:* {error_detail}
-
-Se requiere intervención manual para completar el envío.
-        """
+        descripcion = _DESC_ENVIO_TMPL.substitute(error=error_detail)
         return self.crear_ticket_error(titulo, descripcion, "Envío de Reportes", "High")
     
     def crear_ticket_datos_fallidos(self, ubicaciones: list) -> tuple[bool, str, Optional[str]]:
         """Crea un ticket específico para diferencias en datos"""
         titulo = f"[AUTO] Diferencias detectadas en inventario MP"
-        ubicaciones_str = "\n".join([f"* {u}" for u in ubicaciones[:10]])
+        # Deduplicar preservando orden; el ticket solo lista las primeras 10
+        ubicaciones = list(dict.fromkeys(ubicaciones))
+        head = ubicaciones[:10]
+        ubicaciones_str = "\n".join(f"* {u}" for u in head)
         if len(ubicaciones) > 10:
             ubicaciones_str += f"\n* ... y {len(ubicaciones) - 10} más"
         
-        descripcion = f"""
-El sistema detectó diferencias significativas en los datos de inventario.
-
-*Ubicaciones afectadas:*
-{ubicaciones_str}
-
-Los jobs correctivos fueron ejecutados pero el problema persiste.
-        """
+        descripcion = _DESC_DATOS_TMPL.substitute(ubicaciones=ubicaciones_str)
         return self.crear_ticket_error(titulo, descripcion, "Datos Inventario", "High")
 
@@ -2,51 +2,215 @@
 Notificador - Envío de correos y alertas
 """
 import logging
+from itertools import chain
 from typing import Optional
 from datetime import datetime
 
-import pymssql
+import jinja2
 
-from .config import get_config
+from .config import get_config, SQLServerConfig
+from .sql_client import SQLClient
 
 logger = logging.getLogger(__name__)
 
 
+def _now_iso() -> str:
+    """Timestamp 'YYYY-MM-DD HH:MM:SS' (isoformat es más barato que strftime)"""
+    return datetime.now().isoformat(sep=' ', timespec='seconds')
+
+# Plantillas HTML precompiladas una sola vez por proceso. autoescape evita
+# además que mensajes/detalles con HTML crudo rompan (o inyecten) el correo.
+_env = jinja2.Environment(
+    autoescape=True,
+    loader=jinja2.DictLoader({
+        'alert.html': """\
+<html>
+<body style="font-family: Arial, sans-serif; padding: 20px;">
+    <div style="background-color: #ffebee; border-left: 4px solid #f44336; padding: 15px; margin-bottom: 20px;">
+        <h2 style="color: #c62828; margin: 0;">⚠️ {{ titulo }}</h2>
+    </div>
+
+    <p><strong>Fecha/Hora:</strong> {{ fecha }}</p>
+    <p><strong>Mensaje:</strong> {{ mensaje }}</p>
+
+    {% if detalles %}
+    <div style="background-color: #f5f5f5; padding: 10px; margin: 10px 0; border-radius: 4px;"><pre>{{ detalles }}</pre></div>
+    {% endif %}
+
+    {% if ticket_jira %}
+    <p><strong>🎫 Ticket Jira:</strong>
+       <a href="{{ jira_url }}">{{ ticket_jira }}</a>
+    </p>
+    {% endif %}
+
+    <hr style="border: none; border-top: 1px solid #ddd; margin: 20px 0;">
+
+    <h3>Acciones Recomendadas:</h3>
+    <ol>
+        <li>Verificar el estado del extracto en Tableau Server</li>
+        <li>Revisar los logs del proceso</li>
+        <li>Ejecutar el proceso manualmente si es necesario</li>
+    </ol>
+
+    <p style="color: #666; font-size: 12px; margin-top: 30px;">
+        Este es un mensaje automático del Sistema de Automatización de Reportes MP.
+    </p>
+</body>
+</html>
+""",
+        'success.html': """\
+<html>
+<body style="font-family: Arial, sans-serif; padding: 20px;">
+    <div style="background-color: #e8f5e9; border-left: 4px solid #4caf50; padding: 15px; margin-bottom: 20px;">
+        <h2 style="color: #2e7d32; margin: 0;">✅ Proceso Completado Exitosamente</h2>
+    </div>
+
+    <p><strong>Fecha/Hora:</strong> {{ fecha }}</p>
+    <p><strong>Estado:</strong> {{ mensaje }}</p>
+
+    {% if reportes_enviados %}
+    <h3>Reportes Enviados:</h3>
+    <ul>{% for r in reportes_enviados %}<li>{{ r }}</li>{% endfor %}</ul>
+    {% endif %}
+
+    <p style="color: #666; font-size: 12px; margin-top: 30px;">
+        Este es un mensaje automático del Sistema de Automatización de Reportes MP.
+    </p>
+</body>
+</html>
+""",
+        'summary.html': """\
+<html>
+<body style="font-family: Arial, sans-serif; padding: 20px;">
+    <div style="background-color: {{ '#e8f5e9' if exito else '#ffebee' }};
+                border-left: 4px solid {{ status_color }}; padding: 15px; margin-bottom: 20px;">
+        <h2 style="color: {{ status_color }}; margin: 0;">
+            {{ status_icon }} Proceso de Reportes MP: {{ status_text }}
+        </h2>
+    </div>
+
+    <p><strong>Fecha/Hora:</strong> {{ fecha }}</p>
+    <p><strong>Tiempo Total:</strong> {{ '%.2f'|format(tiempo_total) }} segundos</p>
+    {% if ticket_jira %}
+    <p><strong>Ticket Jira:</strong> <a href="{{ jira_url }}">{{ ticket_jira }}</a></p>
+    {% endif %}
+
+    <h3>Detalle de Ejecución:</h3>
+    <table style="width: 100%; border-collapse: collapse; margin: 10px 0;">
+        <thead>
+            <tr style="background-color: #f5f5f5;">
+                <th style="padding: 10px; text-align: left; border-bottom: 2px solid #ddd;">Paso</th>
+                <th style="padding: 10px; text-align: left; border-bottom: 2px solid #ddd;">Estado</th>
+                <th style="padding: 10px; text-align: left; border-bottom: 2px solid #ddd;">Duración</th>
+            </tr>
+        </thead>
+        <tbody>
+            {{ pasos_rows|safe }}
+        </tbody>
+    </table>
+
+    <p style="color: #666; font-size: 12px; margin-top: 30px;">
+        Sistema de Automatización de Reportes MP
+    </p>
+</body>
+</html>
+""",
+    })
+)
+
+_ROW_TMPL = (
+    '<tr>'
+    '<td style="padding: 8px; border-bottom: 1px solid #ddd;">{nombre}</td>'
+    '<td style="padding: 8px; border-bottom: 1px solid #ddd; color: {color};">{icon} {estado}</td>'
+    '<td style="padding: 8px; border-bottom: 1px solid #ddd;">{duracion}</td>'
+    '</tr>'
+)
+
+_ALERT_TMPL = _env.get_template('alert.html')
+_SUCCESS_TMPL = _env.get_template('success.html')
+_SUMMARY_TMPL = _env.get_template('summary.html')
+
+
 class Notifier:
     """Clase para envío de notificaciones por email"""
-    
-    def __init__(self):
-        self.config = get_config().email
-    
-    def _send_via_dbmail(self, recipients: str, subject: str, body: str, 
+
+    def __init__(self, batch_mode: bool = False):
+        """
+        Args:
+            batch_mode: Si es True, los enviar_* encolan el correo y flush()
+                        despacha todos los pendientes en una sola conexión
+        """
+        config = get_config()
+        self.config = config.email
+        # Snapshot del server de Jira: evita releer la config en cada correo
+        self._jira_server = config.jira.server
+        self.batch_mode = batch_mode
+        self._pending: list[tuple[str, str, str, str]] = []
+        # Reutilizar el pool de SQLClient: cada correo deja de pagar un
+        # login TCP+TDS propio contra el servidor de correo
+        self._sql = SQLClient(SQLServerConfig(
+            server=self.config.server,
+            user=self.config.user,
+            password=self.config.password,
+            database=self.config.database
+        ))
+
+    def _send_via_dbmail(self, recipients: str, subject: str, body: str,
                          body_format: str = 'HTML') -> tuple[bool, str]:
         """Envía email usando SQL Server Database Mail"""
+        if self.batch_mode:
+            self._pending.append((recipients, subject, body, body_format))
+            return (True, "Email encolado (batch)")
+
         try:
-            with pymssql.connect(
-                server=self.config.server,
-                user=self.config.user,
-                password=self.config.password,
-                database=self.config.database,
-                tds_version='7.0',
-                autocommit=True
-            ) as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute(
-                        """EXEC [msdb].[dbo].[sp_send_dbmail] 
-                           @profile_name = %s, 
-                           @recipients = %s, 
-                           @body_format = %s, 
-                           @body = %s, 
-                           @subject = %s""",
-                        (self.config.profile, recipients, body_format, body, subject)
-                    )
+            self._sql.execute_query(
+                """EXEC [msdb].[dbo].[sp_send_dbmail] 
+                   @profile_name = %s, 
+                   @recipients = %s, 
+                   @body_format = %s, 
+                   @body = %s, 
+                   @subject = %s""",
+                (self.config.profile, recipients, body_format, body, subject)
+            )
             
             logger.info(f"Email enviado a: {recipients}")
             return (True, "Email enviado exitosamente")
-            
+
         except Exception as e:
             logger.error(f"Error enviando email: {e}")
             return (False, str(e))
+
+    def flush(self) -> tuple[bool, str]:
+        """Despacha todos los correos encolados en una sola ida y vuelta a msdb"""
+        if not self._pending:
+            return (True, "Sin correos pendientes")
+
+        mensajes, self._pending = self._pending, []
+
+        # Un solo batch de EXECs: una conexión y un round-trip para N correos
+        batch = "; ".join(
+            """EXEC [msdb].[dbo].[sp_send_dbmail]
+               @profile_name = %s,
+               @recipients = %s,
+               @body_format = %s,
+               @body = %s,
+               @subject = %s"""
+            for _ in mensajes
+        )
+        params = tuple(chain.from_iterable(
+            (self.config.profile, recipients, body_format, body, subject)
+            for recipients, subject, body, body_format in mensajes
+        ))
+
+        try:
+            self._sql.execute_query(batch, params)
+
+            logger.info(f"{len(mensajes)} emails enviados en un solo batch")
+            return (True, f"{len(mensajes)} emails enviados")
+
+        except Exception as e:
+            logger.error(f"Error enviando batch de emails: {e}")
+            return (False, str(e))
     
     def enviar_alerta_error(self, titulo: str, mensaje: str, 
                            detalles: str = "", ticket_jira: str = None) -> tuple[bool, str]:
@@ -59,47 +223,19 @@ class Notifier:
             detalles: Detalles adicionales (opcional)
             ticket_jira: Key del ticket creado (opcional)
         """
-        fecha = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        ticket_html = ""
-        if ticket_jira:
-            jira_url = f"{get_config().jira.server}/browse/{ticket_jira}"
-            ticket_html = f"""
-            <p><strong>🎫 Ticket Jira:</strong> 
-               <a href="{jira_url}">{ticket_jira}</a>
-            </p>
-            """
-        
-        body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; padding: 20px;">
-            <div style="background-color: #ffebee; border-left: 4px solid #f44336; padding: 15px; margin-bottom: 20px;">
-                <h2 style="color: #c62828; margin: 0;">⚠️ {titulo}</h2>
-            </div>
-            
-            <p><strong>Fecha/Hora:</strong> {fecha}</p>
-            <p><strong>Mensaje:</strong> {mensaje}</p>
-            
-            {f'<div style="background-color: #f5f5f5; padding: 10px; margin: 10px 0; border-radius: 4px;"><pre>{detalles}</pre></div>' if detalles else ''}
-            
-            {ticket_html}
-            
-            <hr style="border: none; border-top: 1px solid #ddd; margin: 20px 0;">
-            
-            <h3>Acciones Recomendadas:</h3>
-            <ol>
-                <li>Verificar el estado del extracto en Tableau Server</li>
-                <li>Revisar los logs del proceso</li>
-                <li>Ejecutar el proceso manualmente si es necesario</li>
-            </ol>
-            
-            <p style="color: #666; font-size: 12px; margin-top: 30px;">
-                Este es un mensaje automático del Sistema de Automatización de Reportes MP.
-            </p>
-        </body>
-        </html>
-        """
-        
+        fecha = _now_iso()
+
+        jira_url = f"{self._jira_server}/browse/{ticket_jira}" if ticket_jira else None
+
+        body = _ALERT_TMPL.render(
+            titulo=titulo,
+            fecha=fecha,
+            mensaje=mensaje,
+            detalles=detalles,
+            ticket_jira=ticket_jira,
+            jira_url=jira_url
+        )
+
         subject = f"🔴 ALERTA MP: {titulo}"
         return self._send_via_dbmail(self.config.error_recipients, subject, body)
     
@@ -112,35 +248,14 @@ class Notifier:
             mensaje: Mensaje principal
             reportes_enviados: Lista de reportes enviados (opcional)
         """
-        fecha = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        reportes_html = ""
-        if reportes_enviados:
-            reportes_list = "\n".join([f"<li>{r}</li>" for r in reportes_enviados])
-            reportes_html = f"""
-            <h3>Reportes Enviados:</h3>
-            <ul>{reportes_list}</ul>
-            """
-        
-        body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; padding: 20px;">
-            <div style="background-color: #e8f5e9; border-left: 4px solid #4caf50; padding: 15px; margin-bottom: 20px;">
-                <h2 style="color: #2e7d32; margin: 0;">✅ Proceso Completado Exitosamente</h2>
-            </div>
-            
-            <p><strong>Fecha/Hora:</strong> {fecha}</p>
-            <p><strong>Estado:</strong> {mensaje}</p>
-            
-            {reportes_html}
-            
-            <p style="color: #666; font-size: 12px; margin-top: 30px;">
-                Este es un mensaje automático del Sistema de Automatización de Reportes MP.
-            </p>
-        </body>
-        </html>
-        """
-        
+        fecha = _now_iso()
+
+        body = _SUCCESS_TMPL.render(
+            fecha=fecha,
+            mensaje=mensaje,
+            reportes_enviados=reportes_enviados
+        )
+
         subject = f"✅ Reportes MP: {mensaje}"
         return self._send_via_dbmail(self.config.success_recipients, subject, body)
     
@@ -148,7 +263,8 @@ class Notifier:
                                exito: bool,
                                pasos_ejecutados: list[dict],
                                tiempo_total: float,
-                               ticket_jira: str = None) -> tuple[bool, str]:
+                               ticket_jira: str = None,
+                               fecha: str = None) -> tuple[bool, str]:
         """
         Envía un resumen detallado del proceso.
         
@@ -157,66 +273,40 @@ class Notifier:
             pasos_ejecutados: Lista de pasos con su estado
             tiempo_total: Tiempo total de ejecución en segundos
             ticket_jira: Ticket creado en caso de error
+            fecha: Timestamp a mostrar; permite compartir uno entre correos
         """
-        fecha = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        fecha = fecha or _now_iso()
         
-        # Construir tabla de pasos
-        pasos_rows = ""
-        for paso in pasos_ejecutados:
-            icon = "✅" if paso.get('success', False) else "❌"
-            color = "#4caf50" if paso.get('success', False) else "#f44336"
-            pasos_rows += f"""
-            <tr>
-                <td style="padding: 8px; border-bottom: 1px solid #ddd;">{paso.get('nombre', 'N/A')}</td>
-                <td style="padding: 8px; border-bottom: 1px solid #ddd; color: {color};">{icon} {paso.get('estado', 'N/A')}</td>
-                <td style="padding: 8px; border-bottom: 1px solid #ddd;">{paso.get('duracion', 'N/A')}</td>
-            </tr>
-            """
+        # Construir tabla de pasos: un solo join en vez de concatenar O(n²)
+        pasos_rows = "".join(
+            _ROW_TMPL.format(
+                nombre=paso.get('nombre', 'N/A'),
+                estado=paso.get('estado', 'N/A'),
+                duracion=paso.get('duracion', 'N/A'),
+                icon="✅" if paso.get('success', False) else "❌",
+                color="#4caf50" if paso.get('success', False) else "#f44336"
+            )
+            for paso in pasos_ejecutados
+        )
         
         status_color = "#4caf50" if exito else "#f44336"
         status_text = "EXITOSO" if exito else "FALLIDO"
         status_icon = "✅" if exito else "❌"
-        
-        ticket_html = ""
-        if ticket_jira:
-            jira_url = f"{get_config().jira.server}/browse/{ticket_jira}"
-            ticket_html = f'<p><strong>Ticket Jira:</strong> <a href="{jira_url}">{ticket_jira}</a></p>'
-        
-        body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; padding: 20px;">
-            <div style="background-color: {'#e8f5e9' if exito else '#ffebee'}; 
-                        border-left: 4px solid {status_color}; padding: 15px; margin-bottom: 20px;">
-                <h2 style="color: {status_color}; margin: 0;">
-                    {status_icon} Proceso de Reportes MP: {status_text}
-                </h2>
-            </div>
-            
-            <p><strong>Fecha/Hora:</strong> {fecha}</p>
-            <p><strong>Tiempo Total:</strong> {tiempo_total:.2f} segundos</p>
-            {ticket_html}
-            
-            <h3>Detalle de Ejecución:</h3>
-            <table style="width: 100%; border-collapse: collapse; margin: 10px 0;">
-                <thead>
-                    <tr style="background-color: #f5f5f5;">
-                        <th style="padding: 10px; text-align: left; border-bottom: 2px solid #ddd;">Paso</th>
-                        <th style="padding: 10px; text-align: left; border-bottom: 2px solid #ddd;">Estado</th>
-                        <th style="padding: 10px; text-align: left; border-bottom: 2px solid #ddd;">Duración</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    {pasos_rows}
-                </tbody>
-            </table>
-            
-            <p style="color: #666; font-size: 12px; margin-top: 30px;">
-                Sistema de Automatización de Reportes MP
-            </p>
-        </body>
-        </html>
-        """
-        
+
+        jira_url = f"{self._jira_server}/browse/{ticket_jira}" if ticket_jira else None
+
+        body = _SUMMARY_TMPL.render(
+            exito=exito,
+            fecha=fecha,
+            tiempo_total=tiempo_total,
+            status_color=status_color,
+            status_text=status_text,
+            status_icon=status_icon,
+            ticket_jira=ticket_jira,
+            jira_url=jira_url,
+            pasos_rows=pasos_rows
+        )
+
         subject = f"{status_icon} Resumen Reportes MP: {status_text} - {fecha}"
         recipients = self.config.error_recipients if not exito else self.config.success_recipients
         
@@ -2,7 +2,11 @@
 Cliente SQL Server - Conexiones y ejecución de queries/jobs
 """
 import time
+import random
 import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Any
 import pymssql
 
@@ -10,102 +14,339 @@ from .config import get_config, SQLServerConfig
 
 logger = logging.getLogger(__name__)
 
+# Pool de conexiones keep-alive: lista de conexiones libres por (server, database).
+# Evita pagar el handshake TCP+TDS en cada query (crítico en loops de polling).
+_pool: dict[tuple[str, str], list[Any]] = {}
+_pool_lock = threading.Lock()
+
+# TDS 7.4 habilita el fetch de varias filas por buffer de red (bajar a '7.0'
+# solo si algún servidor legado no lo negocia)
+_TDS_VERSION = '7.4' 
+
+# Estado de un job vía sp_executesql: el texto parametrizado es idéntico en
+# cada iteración del polling, así que SQL Server reutiliza el plan preparado
+# en vez de parsear/compilar el batch ad-hoc cada vez.
+_PREPARED_STATUS_SQL = (
+    "EXEC sp_executesql N'"
+    "SELECT TOP 1 "
+    "ja.run_requested_date, "
+    "ja.stop_execution_date, "
+    "CASE WHEN ja.stop_execution_date IS NULL THEN ''Running'' ELSE ''Completed'' END AS job_status "
+    "FROM msdb.dbo.sysjobs j "
+    "JOIN msdb.dbo.sysjobactivity ja ON j.job_id = ja.job_id "
+    "WHERE j.name = @name "
+    "AND ja.run_requested_date IS NOT NULL "
+    "AND CONVERT(VARCHAR(10), ja.run_requested_date, 112) = CONVERT(VARCHAR(10), GETDATE(), 112) "
+    "ORDER BY ja.run_requested_date DESC"
+    "', N'@name sysname', @name=%s"
+)
+
 
 class SQLClient:
     """Cliente para conexiones a SQL Server"""
-    
+
     def __init__(self, config: SQLServerConfig):
         self.config = config
-    
-    def execute_query(self, query: str, params: tuple = (), database: str = None) -> list[dict]:
-        """Ejecuta una query y retorna los resultados como lista de diccionarios"""
-        db = database or self.config.database
-        
+
+    def _connect(self, db: str):
+        """Abre una conexión nueva al servidor"""
         logger.info(f"Conectando a {self.config.server}/{db}")
-        
-        try:
-            with pymssql.connect(
-                server=self.config.server,
-                user=self.config.user,
-                password=self.config.password,
-                database=db,
-                tds_version='7.0',
-                autocommit=True
-            ) as conn:
-                with conn.cursor(as_dict=True) as cursor:
-                    logger.debug(f"Ejecutando: {query[:100]}...")
-                    cursor.execute(query, params)
+        return pymssql.connect(
+            server=self.config.server,
+            user=self.config.user,
+            password=self.config.password,
+            database=db,
+            tds_version=_TDS_VERSION,
+            autocommit=True
+        )
+
+    def _acquire(self, db: str):
+        """Obtiene una conexión del pool (validada con un ping) o abre una nueva"""
+        key = (self.config.server, db)
+        while True:
+            with _pool_lock:
+                free = _pool.get(key)
+                conn = free.pop() if free else None
+
+            if conn is None:
+                return self._connect(db)
+
+            # Validar siempre con un ping barato: una conexión muerta se
+            # descarta aquí, en lugar de reintentar (y potencialmente
+            # duplicar) el statement real si fallara a mitad de ejecución
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchall()
+                return conn
+            except Exception:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+    def _release(self, db: str, conn) -> None:
+        """Devuelve una conexión al pool (el ping de _acquire filtra las rotas)"""
+        key = (self.config.server, db)
+        with _pool_lock:
+            _pool.setdefault(key, []).append(conn)
+
+    @staticmethod
+    def close():
+        """Cierra todas las conexiones del pool (llamar al terminar el proceso)"""
+        with _pool_lock:
+            for free in _pool.values():
+                for conn in free:
                     try:
-                        result = cursor.fetchall()
-                        return result
+                        conn.close()
                     except Exception:
-                        return []
+                        pass
+            _pool.clear()
+
+    def execute_query(self, query: str, params: tuple = (), database: str = None,
+                      as_dict: bool = True) -> list:
+        """
+        Ejecuta una query y retorna los resultados.
+
+        Con as_dict=True (default) cada fila es un diccionario; con
+        as_dict=False las filas son namedtuples, que evitan un dict por fila
+        (menos memoria y sin hash de claves en resultados grandes).
+        """
+        db = database or self.config.database
+
+        try:
+            return self._run_query(db, query, params, as_dict)
         except Exception as e:
             logger.error(f"Error ejecutando query en {self.config.server}: {e}")
             raise
+
+    @staticmethod
+    def _fetch_rows(cursor, as_dict: bool) -> list:
+        """Materializa las filas del cursor (dicts o namedtuples según as_dict)"""
+        try:
+            result = cursor.fetchall()
+        except Exception:
+            return []
+        if not as_dict and result and cursor.description:
+            cols = [d[0] for d in cursor.description]
+            Row = namedtuple("Row", cols, rename=True)
+            result = [Row._make(r) for r in result]
+        return result
+
+    def _run_query(self, db: str, query: str, params: tuple, as_dict: bool = True) -> list:
+        """Ejecuta una query sobre una conexión del pool"""
+        conn = self._acquire(db)
+        try:
+            with conn.cursor(as_dict=as_dict) as cursor:
+                logger.debug(f"Ejecutando: {query[:100]}...")
+                cursor.execute(query, params)
+                result = self._fetch_rows(cursor, as_dict)
+        finally:
+            # Devolver siempre la conexión: si quedó rota, el ping de
+            # _acquire la descartará en el próximo uso
+            self._release(db, conn)
+        return result
+
+    def execute_sp(self, sp_name: str, params: tuple = (), database: str = None,
+                   as_dict: bool = True) -> list:
+        """
+        Ejecuta un stored procedure vía RPC (callproc), que llega al plan
+        cacheado del servidor en vez de compilar un batch EXEC ad-hoc.
+        """
+        db = database or self.config.database
+
+        try:
+            return self._run_callproc(db, sp_name, params, as_dict)
+        except Exception as e:
+            logger.error(f"Error ejecutando SP '{sp_name}' en {self.config.server}: {e}")
+            raise
+
+    def _run_batch_status(self, db: str, query: str, params: tuple) -> list:
+        """
+        Ejecuta un batch de varios statements y retorna el último rowset.
+        Usado para encadenar sp_start_job + primer estado en un round-trip.
+        """
+        conn = self._acquire(db)
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                cursor.execute(query, params)
+                rows = self._fetch_rows(cursor, True)
+                # sp_start_job no produce rowset: avanzar hasta el SELECT final
+                while cursor.nextset():
+                    nuevos = self._fetch_rows(cursor, True)
+                    if nuevos:
+                        rows = nuevos
+        finally:
+            self._release(db, conn)
+        return rows
+
+    def _run_callproc(self, db: str, sp_name: str, params: tuple, as_dict: bool = True) -> list:
+        """Ejecuta un SP por la vía RPC sobre una conexión del pool"""
+        conn = self._acquire(db)
+        try:
+            with conn.cursor(as_dict=as_dict) as cursor:
+                logger.debug(f"Ejecutando SP: {sp_name}")
+                cursor.callproc(sp_name, params)
+                result = self._fetch_rows(cursor, as_dict)
+        finally:
+            self._release(db, conn)
+        return result
     
-    def execute_sp(self, sp_name: str, params: tuple = (), database: str = None) -> list[dict]:
-        """Ejecuta un stored procedure"""
-        query = f"EXEC {sp_name}"
-        if params:
-            placeholders = ", ".join(["%s"] * len(params))
-            query = f"EXEC {sp_name} {placeholders}"
-        
-        return self.execute_query(query, params, database)
-    
-    def execute_job(self, job_name: str, wait_for_completion: bool = True, 
-                    check_interval: int = 10, max_wait: int = 600) -> tuple[bool, str]:
+    def _status_stream(self, job_name: str):
+        """
+        Generador que mantiene una conexión y un cursor abiertos durante el
+        polling de estado de un job: cada next() reutiliza el mismo cursor en
+        lugar de crear conexión+cursor por iteración. Al cerrarse (o ante una
+        conexión rota) devuelve/descarta la conexión como _run_query.
+        """
+        conn = self._acquire("msdb")
+        broken = False
+        try:
+            with conn.cursor(as_dict=True) as cursor:
+                while True:
+                    try:
+                        cursor.execute(_PREPARED_STATUS_SQL, (job_name,))
+                        rows = cursor.fetchall()
+                    except (pymssql.InterfaceError, pymssql.OperationalError):
+                        broken = True
+                        raise
+                    yield rows[0] if rows else None
+        finally:
+            if broken:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            else:
+                self._release("msdb", conn)
+
+    def setup_service_broker(self) -> tuple[bool, str]:
+        """
+        Crea (si no existen) la cola y el servicio de Service Broker en msdb
+        usados para señalizar el fin de un job. El último paso del job debe
+        hacer SEND sobre el servicio 'JobDoneService' con el nombre del job.
+
+        Returns:
+            tuple: (success: bool, message: str)
+        """
+        try:
+            self.execute_query("""
+                IF NOT EXISTS (SELECT 1 FROM sys.service_queues WHERE name = 'JobDoneQueue')
+                    CREATE QUEUE dbo.JobDoneQueue;
+                IF NOT EXISTS (SELECT 1 FROM sys.services WHERE name = 'JobDoneService')
+                    CREATE SERVICE JobDoneService ON QUEUE dbo.JobDoneQueue ([DEFAULT]);
+            """, database="msdb")
+            return (True, "Cola de Service Broker lista")
+        except Exception as e:
+            logger.error(f"Error preparando Service Broker: {e}")
+            return (False, str(e))
+
+    def execute_job(self, job_name: str, wait_for_completion: bool = True,
+                    check_interval: int = 10, max_wait: int = 600,
+                    use_service_broker: bool = False) -> tuple[bool, str]:
         """
         Ejecuta un SQL Agent Job y opcionalmente espera a que termine.
-        
+
+        Con use_service_broker=True el cliente hace WAITFOR (RECEIVE)
+        bloqueante sobre la cola JobDoneQueue (ver setup_service_broker) en
+        lugar de sondear sysjobactivity: una ida y vuelta en vez de
+        max_wait/check_interval, y el fin del job se observa en milisegundos.
+
+        Limitación: RECEIVE consume los mensajes que lee y los que no
+        corresponden a job_name se descartan, así que el modo broker soporta
+        UN solo job en espera a la vez; dos esperas concurrentes pueden
+        comerse mutuamente la señal de fin. El flujo de este repo ejecuta
+        los jobs en secuencia, lo que respeta esa restricción.
+
         Returns:
             tuple: (success: bool, message: str)
         """
         logger.info(f"Iniciando job: {job_name}")
-        
+
         try:
-            # Iniciar el job
-            self.execute_query(
-                f"EXEC msdb.dbo.sp_start_job @job_name = %s",
-                (job_name,),
-                database="msdb"
-            )
-            logger.info(f"Job '{job_name}' iniciado")
-            
-            if not wait_for_completion:
-                return (True, "Job iniciado (sin esperar)")
-            
-            # Esperar a que termine
-            total_waited = 0
-            while total_waited < max_wait:
-                time.sleep(check_interval)
-                total_waited += check_interval
-                
-                result = self.execute_query(f"""
-                    SELECT TOP 1
-                        ja.run_requested_date,
-                        ja.stop_execution_date,
-                        CASE 
-                            WHEN ja.stop_execution_date IS NULL THEN 'Running'
-                            ELSE 'Completed'
-                        END AS job_status
-                    FROM msdb.dbo.sysjobs j
-                    JOIN msdb.dbo.sysjobactivity ja ON j.job_id = ja.job_id
-                    WHERE j.name = %s
-                    AND ja.run_requested_date IS NOT NULL
-                    AND CONVERT(VARCHAR(10), ja.run_requested_date, 112) = CONVERT(VARCHAR(10), GETDATE(), 112)
-                    ORDER BY ja.run_requested_date DESC
-                """, (job_name,), database="msdb")
-                
-                if result:
-                    status = result[0].get('job_status', 'Unknown')
-                    if status == 'Completed':
+            if not wait_for_completion or use_service_broker:
+                # Iniciar el job
+                self.execute_sp(
+                    "msdb.dbo.sp_start_job",
+                    (job_name,),
+                    database="msdb"
+                )
+                logger.info(f"Job '{job_name}' iniciado")
+
+                if not wait_for_completion:
+                    return (True, "Job iniciado (sin esperar)")
+
+                # Bloqueo del lado del servidor hasta la señal de fin de ESTE
+                # job: la cola es compartida, así que se compara message_body
+                # con job_name y los mensajes ajenos se descartan, rearmando
+                # el WAITFOR con el tiempo que quede
+                limite = time.monotonic() + max_wait
+                while True:
+                    restante_ms = int((limite - time.monotonic()) * 1000)
+                    if restante_ms <= 0:
+                        return (False, f"Timeout esperando job después de {max_wait}s")
+                    result = self.execute_query(
+                        """WAITFOR (
+                            RECEIVE TOP(1) CONVERT(NVARCHAR(MAX), message_body) AS body
+                            FROM dbo.JobDoneQueue
+                        ), TIMEOUT %s""",
+                        (restante_ms,),
+                        database="msdb"
+                    )
+                    if not result:
+                        return (False, f"Timeout esperando job después de {max_wait}s")
+                    body = (result[0].get("body") or "").strip()
+                    if body == job_name:
                         logger.info(f"Job '{job_name}' completado")
                         return (True, "Job completado exitosamente")
-                    elif status == 'Running':
-                        logger.debug(f"Job '{job_name}' aún en ejecución... ({total_waited}s)")
-                else:
-                    logger.warning(f"No se pudo obtener estado del job '{job_name}'")
+                    logger.debug(f"Mensaje de otra cola ignorado: {body!r}")
+
+            # Arranque + breve WAITFOR + primer estado en un solo round-trip:
+            # un error de sp_start_job y el primer estado llegan sin esperar
+            # el check_interval completo
+            result = self._run_batch_status(
+                "msdb",
+                "EXEC msdb.dbo.sp_start_job @job_name = %s; "
+                "WAITFOR DELAY '00:00:02'; " + _PREPARED_STATUS_SQL,
+                (job_name, job_name)
+            )
+            logger.info(f"Job '{job_name}' iniciado")
+            total_waited = 2.0
+            delay = 1.0
+            row = result[0] if result else None
+
+            # Esperar a que termine (polling sobre sysjobactivity reutilizando
+            # un solo cursor; ver _status_stream)
+            estado = self._status_stream(job_name)
+            try:
+                while True:
+                    if row:
+                        status = row.get('job_status', 'Unknown')
+                        if status == 'Completed':
+                            logger.info(f"Job '{job_name}' completado")
+                            return (True, "Job completado exitosamente")
+                        elif status == 'Running':
+                            logger.debug(f"Job '{job_name}' aún en ejecución... ({total_waited:.0f}s)")
+                    else:
+                        logger.warning(f"No se pudo obtener estado del job '{job_name}'")
+
+                    if total_waited >= max_wait:
+                        break
+
+                    # Backoff exponencial con jitter de ±20%: los jobs cortos
+                    # se detectan en segundos y los largos sondean menos a msdb
+                    espera = delay * random.uniform(0.8, 1.2)
+                    time.sleep(espera)
+                    total_waited += espera
+                    delay = min(float(check_interval), delay * 2)
+                    try:
+                        row = next(estado)
+                    except (pymssql.InterfaceError, pymssql.OperationalError) as e:
+                        logger.warning(f"Reabriendo cursor de estado tras error de conexión: {e}")
+                        estado = self._status_stream(job_name)
+                        row = next(estado)
+            finally:
+                estado.close()
             
             return (False, f"Timeout esperando job después de {max_wait}s")
             
@@ -121,35 +362,56 @@ class InfoCentralClient(SQLClient):
         config = get_config()
         super().__init__(config.sql_infocentral)
     
-    def validar_inventario(self) -> tuple[bool, str, list[dict]]:
+    def validar_inventario(self, speculative: bool = True) -> tuple[bool, str, list[dict]]:
         """
         Ejecuta el SP de validación de inventario.
-        
+
+        Args:
+            speculative: Si es True, lanza 'obtenerAcciones' en paralelo con
+                         'hayDiferencias' y descarta el resultado si no hubo
+                         diferencias (cada hilo toma su conexión del pool)
+
         Returns:
             tuple: (hay_diferencias: bool, mensaje: str, acciones: list)
         """
         logger.info("Validando inventario en InfoCentral...")
-        
+
+        sp_name = "[db_owner].[RevisarProcesodeInventarioFinalDiario]"
+
         try:
-            # Verificar si hay diferencias
-            result = self.execute_sp(
-                "[db_owner].[RevisarProcesodeInventarioFinalDiario]",
-                ("hayDiferencias",)
-            )
-            
-            if result and result[0].get('DiferenciasOrigenDestino') == 'No hay diferencias contra el origen':
-                logger.info("No hay diferencias en inventario")
-                return (False, "No hay diferencias contra el origen", [])
-            
-            # Obtener acciones correctivas
-            acciones = self.execute_sp(
-                "[db_owner].[RevisarProcesodeInventarioFinalDiario]",
-                ("obtenerAcciones",)
-            )
-            
+            if speculative:
+                # Sin 'with': Executor.__exit__ hace shutdown(wait=True) y el
+                # camino rápido "sin diferencias" se quedaría esperando al
+                # obtenerAcciones especulativo que va a descartar
+                executor = ThreadPoolExecutor(max_workers=2)
+                try:
+                    f_diferencias = executor.submit(
+                        self.execute_sp, sp_name, ("hayDiferencias",), None, False)
+                    f_acciones = executor.submit(self.execute_sp, sp_name, ("obtenerAcciones",))
+
+                    result = f_diferencias.result()
+                    if result and getattr(result[0], 'DiferenciasOrigenDestino', None) == 'No hay diferencias contra el origen':
+                        logger.info("No hay diferencias en inventario")
+                        f_acciones.cancel()  # no-op si ya está corriendo
+                        return (False, "No hay diferencias contra el origen", [])
+
+                    acciones = f_acciones.result()
+                finally:
+                    executor.shutdown(wait=False)
+            else:
+                # Verificar si hay diferencias
+                result = self.execute_sp(sp_name, ("hayDiferencias",), as_dict=False)
+
+                if result and getattr(result[0], 'DiferenciasOrigenDestino', None) == 'No hay diferencias contra el origen':
+                    logger.info("No hay diferencias en inventario")
+                    return (False, "No hay diferencias contra el origen", [])
+
+                # Obtener acciones correctivas
+                acciones = self.execute_sp(sp_name, ("obtenerAcciones",))
+
             logger.warning(f"Se encontraron diferencias. Acciones: {len(acciones)}")
             return (True, "Hay diferencias contra el origen", acciones)
-            
+
         except Exception as e:
             logger.error(f"Error validando inventario: {e}")
             raise
@@ -197,11 +459,12 @@ class DEADWHClient(SQLClient):
         
         try:
             result = self.execute_query("""
-                SELECT 
+                SELECT
                     ClaReporte,
                     NombreReporte,
                     Para,
                     CC,
+                    BCC,
                     CorreoPrueba
                 FROM dbo.TiTraEnvioReportesTableau
                 ORDER BY ClaReporte
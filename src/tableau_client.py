@@ -4,12 +4,13 @@ Cliente Tableau Server - Validación de extractos y descarga de PDFs
 import os
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from io import BytesIO
 from datetime import datetime, timezone, timedelta
 from typing import Optional
 
 import tableauserverclient as TSC
-import PyPDF2
+from pypdf import PdfReader, PdfWriter
 
 from .config import get_config
 
@@ -19,19 +20,42 @@ logger = logging.getLogger(__name__)
 class TableauClient:
     """Cliente para Tableau Server"""
     
+    # Vida útil del caché de datasources (evita repaginar la lista REST
+    # en cada validar/refresh dentro del mismo run)
+    _DS_CACHE_TTL = 60
+
     def __init__(self):
         self.config = get_config().tableau
         self.server: Optional[TSC.Server] = None
         self._connected = False
+        self._ds_cache: Optional[list] = None
+        self._ds_by_name: dict = {}
+        self._ds_cache_ts: float = 0.0
+        # Workbooks ya resueltos (con vistas pobladas) por nombre
+        self._wb_cache: dict = {}
     
     def connect(self) -> bool:
         """Conecta a Tableau Server"""
         try:
+            from requests.adapters import HTTPAdapter
+
+            # Con TABLEAU_CA_BUNDLE configurado se verifica TLS contra ese
+            # bundle; sin él se mantiene el comportamiento histórico
+            verify = self.config.ca_bundle or False
             self.server = TSC.Server(
                 self.config.server,
-                http_options={'verify': False},
+                http_options={'verify': verify},
                 use_server_version=True
             )
+            # Ampliar el pool keep-alive de la sesión interna de TSC: las
+            # decenas de llamadas REST (Pager, populate_views, populate_pdf×N,
+            # ahora en paralelo) reutilizan conexiones TLS en vez de
+            # renegociar el handshake en cada una
+            session = getattr(self.server, '_session', None)
+            if session is not None:
+                adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
             auth = TSC.TableauAuth(
                 self.config.user,
                 self.config.password,
@@ -54,6 +78,12 @@ class TableauClient:
                 logger.info("Desconectado de Tableau Server")
             except Exception:
                 pass
+            try:
+                session = getattr(self.server, '_session', None)
+                if session is not None:
+                    session.close()
+            except Exception:
+                pass
             self._connected = False
     
     def __enter__(self):
@@ -70,22 +100,58 @@ class TableauClient:
         
         logger.info(f"Buscando datasource: {name}")
         
-        all_datasources = list(TSC.Pager(self.server.datasources))
         name_lower = name.lower()
         
-        # Búsqueda exacta
-        for ds in all_datasources:
-            if ds.name.lower() == name_lower:
-                if ds.has_extracts:
-                    logger.info(f"Datasource encontrado: {ds.name} (id={ds.id})")
-                    return ds
+        # 1) Caché local reciente: resolver sin tocar el servidor
+        if (self._ds_cache is not None
+                and time.monotonic() - self._ds_cache_ts <= self._DS_CACHE_TTL):
+            ds = self._ds_by_name.get(name_lower)
+            if ds is not None:
+                logger.info(f"Datasource encontrado: {ds.name} (id={ds.id})")
+                return ds
+        
+        # 2) Filtro exacto del lado del servidor (mismo patrón que los
+        # workbooks en descargar_pdf): transfiere a lo sumo un par de items
+        # en vez de paginar el catálogo completo
+        req_option = TSC.RequestOptions()
+        req_option.filter.add(TSC.Filter(
+            TSC.RequestOptions.Field.Name,
+            TSC.RequestOptions.Operator.Equals,
+            name
+        ))
+        matches, _ = self.server.datasources.get(req_option)
+        for ds in matches:
+            if ds.has_extracts:
+                logger.info(f"Datasource encontrado: {ds.name} (id={ds.id})")
+                return ds
+        
+        # 3) Fallback: listar todo el catálogo y resolverlo en un solo
+        # recorrido que arma el índice exacto (para el caché), detecta el
+        # match exacto y recuerda el primer parcial; .lower() se calcula una
+        # vez por datasource en lugar de una por pasada
+        self._ds_cache = list(TSC.Pager(self.server.datasources))
+        self._ds_cache_ts = time.monotonic()
+        
+        indice = {}
+        parcial = None
+        for ds in self._ds_cache:
+            if not ds.has_extracts:
+                continue
+            n = ds.name.lower()
+            if n not in indice:
+                indice[n] = ds
+            if parcial is None and (name_lower in n or n in name_lower):
+                parcial = ds
+        self._ds_by_name = indice
+        
+        ds = indice.get(name_lower)
+        if ds is not None:
+            logger.info(f"Datasource encontrado: {ds.name} (id={ds.id})")
+            return ds
         
-        # Búsqueda parcial
-        for ds in all_datasources:
-            if name_lower in ds.name.lower() or ds.name.lower() in name_lower:
-                if ds.has_extracts:
-                    logger.info(f"Datasource encontrado (parcial): {ds.name} (id={ds.id})")
-                    return ds
+        if parcial is not None:
+            logger.info(f"Datasource encontrado (parcial): {parcial.name} (id={parcial.id})")
+            return parcial
         
         logger.warning(f"Datasource no encontrado: {name}")
         return None
@@ -151,18 +217,23 @@ class TableauClient:
             job = self.server.datasources.refresh(ds)
             logger.info(f"Job de refresh iniciado: {job.id}")
             
-            # Esperar a que termine
-            wait_interval = 10
-            total_waited = 0
+            # Esperar a que termine, con backoff exponencial: los refresh
+            # cortos se detectan en ~1s y los largos consultan cada 10s
+            interval = 1.0
+            total_waited = 0.0
             
             while total_waited < max_wait_seconds:
-                time.sleep(wait_interval)
-                total_waited += wait_interval
+                time.sleep(interval)
+                total_waited += interval
+                interval = min(interval * 1.5, 10.0)
                 
                 job = self.server.jobs.get_by_id(job.id)
                 
                 if job.finish_code == 0:
                     logger.info(f"Refresh completado exitosamente")
+                    # El updated_at del datasource cambió: invalidar el caché
+                    self._ds_cache = None
+                    self._ds_by_name = {}
                     return (True, "Refresh completado")
                 elif job.finish_code == 1:
                     logger.error(f"Refresh falló: {job.notes}")
@@ -171,7 +242,7 @@ class TableauClient:
                     logger.warning(f"Refresh cancelado")
                     return (False, "Refresh cancelado")
                 
-                logger.debug(f"Esperando refresh... ({total_waited}s)")
+                logger.debug(f"Esperando refresh... ({total_waited:.0f}s)")
             
             return (False, f"Timeout después de {max_wait_seconds}s")
             
@@ -198,24 +269,28 @@ class TableauClient:
         logger.info(f"Descargando PDF: {workbook_name}")
         
         try:
-            # Buscar workbook
-            req_option = TSC.RequestOptions()
-            req_option.filter.add(TSC.Filter(
-                TSC.RequestOptions.Field.Name,
-                TSC.RequestOptions.Operator.Equals,
-                workbook_name
-            ))
-            
-            workbooks, _ = self.server.workbooks.get(req_option)
-            
-            if not workbooks:
-                return (False, f"Workbook '{workbook_name}' no encontrado")
-            
-            if len(workbooks) > 1:
-                logger.warning(f"Múltiples workbooks encontrados, usando el primero")
-            
-            workbook = workbooks[0]
-            self.server.workbooks.populate_views(workbook)
+            # Buscar workbook (cacheado: resolver nombre + poblar vistas
+            # cuesta dos round-trips REST que solo hace falta pagar una vez)
+            workbook = self._wb_cache.get(workbook_name)
+            if workbook is None:
+                req_option = TSC.RequestOptions()
+                req_option.filter.add(TSC.Filter(
+                    TSC.RequestOptions.Field.Name,
+                    TSC.RequestOptions.Operator.Equals,
+                    workbook_name
+                ))
+                
+                workbooks, _ = self.server.workbooks.get(req_option)
+                
+                if not workbooks:
+                    return (False, f"Workbook '{workbook_name}' no encontrado")
+                
+                if len(workbooks) > 1:
+                    logger.warning(f"Múltiples workbooks encontrados, usando el primero")
+                
+                workbook = workbooks[0]
+                self.server.workbooks.populate_views(workbook)
+                self._wb_cache[workbook_name] = workbook
             
             # Configurar orientación
             orientation_map = {
@@ -224,31 +299,66 @@ class TableauClient:
             }
             pdf_orientation = orientation_map.get(orientation, TSC.PDFRequestOptions.Orientation.Portrait)
             
-            # Descargar y combinar PDFs de todas las vistas
-            pdf_merger = PyPDF2.PdfMerger()
+            # maxage alineado con la frescura que ya se exige al extracto:
+            # dentro de esa ventana Tableau sirve el PDF pre-renderizado
+            # (decenas de ms) en vez de re-renderizar cada vista (segundos)
+            maxage = int(get_config().validation.max_extract_age_hours * 60)
             
-            for view in workbook.views:
+            # Descargar los PDFs de todas las vistas en paralelo: cada
+            # populate_pdf es un round-trip HTTPS independiente, así que el
+            # tiempo total baja de N×RTT a ~max(RTT)
+            def _populate_one(view):
                 pdf_options = TSC.PDFRequestOptions(
                     page_type=TSC.PDFRequestOptions.PageType.Letter,
                     orientation=pdf_orientation,
-                    maxage=1
+                    maxage=maxage
                 )
                 self.server.views.populate_pdf(view, pdf_options)
-                stream = BytesIO(view.pdf)
-                pdf_merger.append(stream)
-            
-            # Crear directorio si no existe
+                return view
+
+            views = list(workbook.views)
+
+            # Escribir a un .tmp y publicar con os.replace: un crash a mitad
+            # de escritura nunca deja un PDF truncado visible para la copia
+            tmp_path = output_path + '.tmp'
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+            if len(views) == 1:
+                # Una sola vista: el PDF que entrega el servidor ya es el
+                # archivo final; parsear y re-serializar sería trabajo inútil
+                _populate_one(views[0])
+                with open(tmp_path, 'wb') as f:
+                    f.write(views[0].pdf)
+                    f.flush()
+                    os.fsync(f.fileno())
+                views[0]._pdf = None
+            else:
+                with ThreadPoolExecutor(max_workers=min(8, len(views) or 1)) as executor:
+                    list(executor.map(_populate_one, views))
+
+                # Combinar en el orden original de las vistas; liberar los
+                # bytes de cada vista apenas se copian al writer para no
+                # retener 2-3x el tamaño del PDF combinado en memoria
+                writer = PdfWriter()
+                for view in views:
+                    reader = PdfReader(BytesIO(view.pdf), strict=False)
+                    writer.append_pages_from_reader(reader)
+                    view._pdf = None
+
+                with open(tmp_path, 'wb') as f:
+                    writer.write(f)
+                    f.flush()
+                    os.fsync(f.fileno())
             
-            # Guardar PDF combinado
-            pdf_merger.write(output_path)
-            pdf_merger.close()
-            
-            # Validar tamaño
-            size = os.path.getsize(output_path)
+            # Validar tamaño antes del rename
+            size = os.path.getsize(tmp_path)
             if size < 1000:
+                os.unlink(tmp_path)
                 return (False, f"PDF generado muy pequeño: {size} bytes")
             
+            # Rename atómico dentro del mismo filesystem
+            os.replace(tmp_path, output_path)
+            
             logger.info(f"PDF descargado: {output_path} ({size} bytes)")
             return (True, output_path)
             
@@ -256,53 +366,74 @@ class TableauClient:
             logger.error(f"Error descargando PDF '{workbook_name}': {e}")
             return (False, str(e))
     
-    def descargar_todos_reportes(self, output_dir: str) -> tuple[bool, str, list[str]]:
+    def descargar_todos_reportes(self, output_dir: str,
+                                 on_file_ready=None) -> tuple[bool, str, list[str]]:
         """
         Descarga todos los reportes configurados.
         
+        Args:
+            output_dir: Carpeta donde dejar los PDFs
+            on_file_ready: Callback opcional invocado con la ruta de cada PDF
+                           apenas termina de descargarse (permite encadenar la
+                           copia al share sin esperar al resto)
+        
         Returns:
             tuple: (success: bool, message: str, files: list)
         """
         from datetime import datetime
         
+        # Una sola lectura del reloj: todas las condiciones ven el mismo día
+        # (y no se paga un gettimeofday por entrada)
+        today = datetime.today()
+        wd = today.weekday()
+        dom = today.day
+        
         # Configuración de reportes
         reportes = [
             {'name': 'Reporte Costo Puesto en Patios', 'alias': 'Reporte Costo Puesto en Patios', 
-             'orientation': 'Portrait', 'condition': datetime.today().weekday() != 0},
+             'orientation': 'Portrait', 'condition': wd != 0},
             {'name': 'Reporte Costo Puesto en Patios (Inicio Semana)', 'alias': 'Reporte Costo Puesto en Patios', 
-             'orientation': 'Portrait', 'condition': datetime.today().weekday() == 0},
+             'orientation': 'Portrait', 'condition': wd == 0},
             {'name': 'Reporte Inventario Diario', 'alias': 'Reporte Inventario Diario', 
              'orientation': 'Portrait', 'condition': True},
             {'name': 'Reporte Compra Chatarra Prom Dia Habil', 'alias': 'Reporte Compra Chatarra Prom Dia Habil', 
-             'orientation': 'Landscape', 'condition': datetime.today().day != 1},
+             'orientation': 'Landscape', 'condition': dom != 1},
             {'name': 'Reporte Compra Chatarra Prom Dia Habil Dia Primero', 'alias': 'Reporte Compra Chatarra Prom Dia Habil', 
-             'orientation': 'Landscape', 'condition': datetime.today().day == 1},
+             'orientation': 'Landscape', 'condition': dom == 1},
             {'name': 'Reporte de Compras e Inventario por Tipo de Material', 'alias': 'Reporte de Compras e Inventario por Tipo de Material', 
              'orientation': 'Portrait', 'condition': True},
             {'name': 'Reporte NUEVO Patios - Compras Nacionales + Importaciones', 'alias': 'Reporte NUEVO Patios - Compras Nacionales + Importaciones', 
-             'orientation': 'Portrait', 'condition': datetime.today().weekday() != 0},
+             'orientation': 'Portrait', 'condition': wd != 0},
             {'name': 'Reporte NUEVO Patios - Compras Nacionales + Importaciones_InicioSem', 'alias': 'Reporte NUEVO Patios - Compras Nacionales + Importaciones', 
-             'orientation': 'Portrait', 'condition': datetime.today().weekday() == 0}
+             'orientation': 'Portrait', 'condition': wd == 0}
         ]
         
         downloaded_files = []
         errors = []
         
-        for reporte in reportes:
-            if not reporte['condition']:
-                continue
-            
-            output_path = os.path.join(output_dir, f"{reporte['alias']}.pdf")
-            success, msg = self.descargar_pdf(
-                reporte['name'],
-                output_path,
-                reporte['orientation']
-            )
-            
-            if success:
-                downloaded_files.append(output_path)
-            else:
-                errors.append(f"{reporte['name']}: {msg}")
+        pendientes = [r for r in reportes if r['condition']]
+        
+        # Descargar varios workbooks a la vez: cada descarga es una cadena de
+        # llamadas REST independiente, así que los tiempos de red se solapan
+        with ThreadPoolExecutor(max_workers=min(4, len(pendientes) or 1)) as executor:
+            futures = {
+                executor.submit(
+                    self.descargar_pdf,
+                    reporte['name'],
+                    os.path.join(output_dir, f"{reporte['alias']}.pdf"),
+                    reporte['orientation']
+                ): reporte
+                for reporte in pendientes
+            }
+            for future in as_completed(futures):
+                reporte = futures[future]
+                success, msg = future.result()
+                if success:
+                    downloaded_files.append(msg)
+                    if on_file_ready is not None:
+                        on_file_ready(msg)
+                else:
+                    errors.append(f"{reporte['name']}: {msg}")
         
         if errors:
             return (False, f"Errores en {len(errors)} reportes: {'; '.join(errors)}", downloaded_files)
@@ -2,9 +2,12 @@
 Workflow Orquestador - Flujo principal de automatización
 """
 import os
+import queue
 import shutil
+import threading
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Callable, Optional
 from dataclasses import dataclass, field
@@ -18,7 +21,7 @@ from .notifier import Notifier
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class StepResult:
     """Resultado de un paso del workflow"""
     nombre: str
@@ -26,15 +29,20 @@ class StepResult:
     mensaje: str
     duracion: float = 0.0
     detalles: dict = field(default_factory=dict)
+    _cached_dict: Optional[dict] = field(default=None, repr=False, compare=False)
     
     def to_dict(self) -> dict:
-        return {
-            'nombre': self.nombre,
-            'success': self.success,
-            'estado': self.mensaje,
-            'duracion': f"{self.duracion:.2f}s",
-            'detalles': self.detalles
-        }
+        # El resultado no cambia tras crearse: formatear la duración y armar
+        # el dict una sola vez aunque UI, resumen y notifier lo pidan cada uno
+        if self._cached_dict is None:
+            self._cached_dict = {
+                'nombre': self.nombre,
+                'success': self.success,
+                'estado': self.mensaje,
+                'duracion': f"{self.duracion:.2f}s",
+                'detalles': self.detalles
+            }
+        return self._cached_dict
 
 
 class ReportWorkflow:
@@ -61,6 +69,9 @@ class ReportWorkflow:
         self.steps: list[StepResult] = []
         self.start_time: Optional[float] = None
         self.ticket_jira: Optional[str] = None
+        # Cola que usa run_full para despachar los callbacks de UI desde el
+        # hilo que lo invocó (ver _execute_step y _despachar_callbacks)
+        self._step_queue: Optional[queue.Queue] = None
     
     def _execute_step(self, nombre: str, func: Callable) -> StepResult:
         """Ejecuta un paso y registra el resultado"""
@@ -86,7 +97,13 @@ class ReportWorkflow:
             )
         
         self.steps.append(result)
-        self.on_step_complete(result)
+        if self._step_queue is not None:
+            # Las ramas paralelas no invocan el callback directamente: la UI
+            # de Streamlit no tolera session_state desde hilos trabajadores
+            # sin ScriptRunContext, así que run_full lo despacha en su hilo
+            self._step_queue.put(result)
+        else:
+            self.on_step_complete(result)
         
         log_func = logger.info if result.success else logger.error
         log_func(f"{nombre}: {'OK' if result.success else 'FAIL'} {result.mensaje}")
@@ -97,19 +114,25 @@ class ReportWorkflow:
         """Maneja un error creando ticket de Jira y enviando notificación"""
         logger.error(f"Error en workflow: {paso_fallido} - {error}")
         
-        # Crear ticket en Jira
+        # Crear ticket en Jira en segundo plano mientras preparamos el correo
         jira = JiraClient()
-        success, msg, ticket_key = jira.crear_ticket_error(
+        futuro_ticket = jira.crear_ticket_error_async(
             titulo=f"[AUTO] Error en Reportes MP: {paso_fallido}",
             descripcion=error
         )
         
-        if success:
-            self.ticket_jira = ticket_key
-            logger.info(f"Ticket Jira creado: {ticket_key}")
+        notifier = Notifier()
+        
+        # Esperar el ticket solo cuando hace falta el key para el correo
+        try:
+            success, msg, ticket_key = futuro_ticket.result(timeout=10)
+            if success:
+                self.ticket_jira = ticket_key
+                logger.info(f"Ticket Jira creado: {ticket_key}")
+        except Exception as e:
+            logger.error(f"Error esperando ticket de Jira: {e}")
         
         # Enviar notificación de error
-        notifier = Notifier()
         notifier.enviar_alerta_error(
             titulo=f"Error en: {paso_fallido}",
             mensaje=error,
@@ -215,91 +238,32 @@ class ReportWorkflow:
         self.ticket_jira = None
         
         try:
-            # === PASO 1: Validar extracto de Tableau ===
-            with TableauClient() as tableau:
-                result = self._execute_step(
-                    "1. Validar Extracto Tableau",
-                    lambda: self._wrap_validacion(tableau.validar_extracto())
-                )
-                
-                if not result.success:
-                    # Intentar refresh
-                    result = self._execute_step(
-                        "1.1 Refresh Extracto",
-                        lambda: (*tableau.refresh_extracto(), {})
-                    )
-                    
-                    if not result.success:
-                        self._handle_error("Refresh de Extracto", result.mensaje)
-                        return (False, f"Error en extracto: {result.mensaje}")
-                    
-                    # Revalidar después del refresh
-                    result = self._execute_step(
-                        "1.2 Revalidar Extracto",
-                        lambda: self._wrap_validacion(tableau.validar_extracto())
-                    )
-                    
-                    if not result.success:
-                        self._handle_error("Validación post-refresh", result.mensaje)
-                        return (False, f"Extracto sigue desactualizado: {result.mensaje}")
-            
-            # === PASO 2: Validar datos en SQL Server ===
-            infocentral = InfoCentralClient()
-            hay_diferencias = False
-            acciones = []
+            # Las ramas de Tableau (pasos 1, 3 y 4) y de SQL (paso 2) no
+            # dependen entre sí: corren en paralelo y el envío de correos
+            # espera a ambas. El tiempo total pasa de sum(ramas) a max(ramas).
+            # Mientras corren, los resultados de cada paso se despachan al
+            # callback de UI desde este hilo.
+            cola_pasos: queue.Queue = queue.Queue()
+            self._step_queue = cola_pasos
+            try:
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    f_tableau = executor.submit(self._rama_tableau)
+                    f_sql = executor.submit(self._rama_sql)
+                    while not (f_tableau.done() and f_sql.done()):
+                        self._despachar_callbacks(cola_pasos, timeout=0.2)
+            finally:
+                self._step_queue = None
+            self._despachar_callbacks(cola_pasos)
             
-            result = self._execute_step(
-                "2. Validar Inventario SQL",
-                lambda: self._validar_inventario(infocentral)
-            )
+            ok_tableau, msg_tableau, fallo_tableau = f_tableau.result()
+            ok_sql, msg_sql, fallo_sql = f_sql.result()
             
-            if not result.success and result.detalles.get('hay_diferencias'):
-                hay_diferencias = True
-                acciones = result.detalles.get('acciones', [])
-                
-                # Ejecutar jobs correctivos
-                result = self._execute_step(
-                    "2.1 Ejecutar Jobs Correctivos",
-                    lambda: self._ejecutar_jobs_correctivos(infocentral, acciones)
-                )
-                
-                if not result.success:
-                    self._handle_error("Jobs Correctivos", result.mensaje)
-                    return (False, f"Error en jobs correctivos: {result.mensaje}")
-                
-                # Actualizar cubo
-                cubosofi = CubosOfiClient()
-                result = self._execute_step(
-                    "2.2 Actualizar Cubo",
-                    lambda: (*cubosofi.ejecutar_job_inventario(), {})
-                )
-                
-                if not result.success:
-                    self._handle_error("Actualización de Cubo", result.mensaje)
-                    return (False, f"Error actualizando cubo: {result.mensaje}")
-            
-            # === PASO 3: Descargar PDFs de Tableau ===
-            with TableauClient() as tableau:
-                result = self._execute_step(
-                    "3. Descargar PDFs",
-                    lambda: self._descargar_pdfs(tableau)
-                )
-                
-                if not result.success:
-                    self._handle_error("Descarga de PDFs", result.mensaje)
-                    return (False, f"Error descargando PDFs: {result.mensaje}")
-                
-                archivos_descargados = result.detalles.get('archivos', [])
-            
-            # === PASO 4: Copiar a carpeta compartida ===
-            result = self._execute_step(
-                "4. Copiar a DEADWH",
-                lambda: self._copiar_archivos()
-            )
-            
-            if not result.success:
-                self._handle_error("Copia de Archivos", result.mensaje)
-                return (False, f"Error copiando archivos: {result.mensaje}")
+            # Un solo ticket/alerta aunque fallen ambas ramas, igual que el
+            # flujo secuencial que se detenía en el primer error
+            fallo = fallo_tableau or fallo_sql
+            if fallo is not None:
+                self._handle_error(*fallo)
+                return (False, msg_tableau if not ok_tableau else msg_sql)
             
             # === PASO 5: Enviar correos ===
             deadwh = DEADWHClient()
@@ -333,6 +297,127 @@ class ReportWorkflow:
             self._handle_error("Error Inesperado", str(e))
             return (False, str(e))
     
+    def _despachar_callbacks(self, cola: queue.Queue, timeout: float = None):
+        """Invoca on_step_complete en este hilo para los pasos encolados"""
+        bloquear = timeout is not None
+        while True:
+            try:
+                result = cola.get(timeout=timeout) if bloquear else cola.get_nowait()
+            except queue.Empty:
+                return
+            bloquear = False
+            self.on_step_complete(result)
+    
+    def _rama_tableau(self) -> tuple[bool, str, Optional[tuple]]:
+        """Rama Tableau del flujo: validar/refrescar extracto, descargar PDFs
+        y copiarlos a la carpeta compartida (pasos 1, 3 y 4).
+        
+        Returns:
+            tuple: (success, message, fallo) donde fallo es
+                   (paso_fallido, error) para que run_full maneje el error
+                   una sola vez, o None
+        """
+        # Rutas resueltas una sola vez: los helpers reciben los valores en
+        # lugar de recorrer self.config.paths.* en cada llamada
+        paths = self.config.paths
+        src, dst = paths.pdf_source, paths.pdf_dest
+        
+        # === PASO 1: Validar extracto de Tableau ===
+        with TableauClient() as tableau:
+            result = self._execute_step(
+                "1. Validar Extracto Tableau",
+                lambda: self._wrap_validacion(tableau.validar_extracto())
+            )
+            
+            if not result.success:
+                # Intentar refresh
+                result = self._execute_step(
+                    "1.1 Refresh Extracto",
+                    lambda: (*tableau.refresh_extracto(), {})
+                )
+                
+                if not result.success:
+                    return (False, f"Error en extracto: {result.mensaje}",
+                            ("Refresh de Extracto", result.mensaje))
+                
+                # Revalidar después del refresh
+                result = self._execute_step(
+                    "1.2 Revalidar Extracto",
+                    lambda: self._wrap_validacion(tableau.validar_extracto())
+                )
+                
+                if not result.success:
+                    return (False, f"Extracto sigue desactualizado: {result.mensaje}",
+                            ("Validación post-refresh", result.mensaje))
+            
+            # === PASO 3: Descargar PDFs de Tableau ===
+            result = self._execute_step(
+                "3. Descargar PDFs",
+                lambda: self._descargar_pdfs(tableau, src, dst)
+            )
+            
+            if not result.success:
+                return (False, f"Error descargando PDFs: {result.mensaje}",
+                        ("Descarga de PDFs", result.mensaje))
+        
+        # === PASO 4: Copiar a carpeta compartida ===
+        # (si el pipeline del paso 3 ya copió, este paso solo reporta)
+        result = self._execute_step(
+            "4. Copiar a DEADWH",
+            lambda r=result: self._copiar_archivos(
+                src, dst,
+                copiados=r.detalles.get('copiados'),
+                errores_copia=r.detalles.get('errores_copia')
+            )
+        )
+        
+        if not result.success:
+            return (False, f"Error copiando archivos: {result.mensaje}",
+                    ("Copia de Archivos", result.mensaje))
+        
+        return (True, "Rama Tableau completada", None)
+    
+    def _rama_sql(self) -> tuple[bool, str, Optional[tuple]]:
+        """Rama SQL del flujo: validar inventario y, si hay diferencias,
+        ejecutar jobs correctivos y actualizar el cubo (paso 2).
+        
+        Returns:
+            tuple: (success, message, fallo) con el mismo contrato que
+                   _rama_tableau
+        """
+        infocentral = InfoCentralClient()
+        
+        result = self._execute_step(
+            "2. Validar Inventario SQL",
+            lambda: self._validar_inventario(infocentral)
+        )
+        
+        if not result.success and result.detalles.get('hay_diferencias'):
+            acciones = result.detalles.get('acciones', [])
+            
+            # Ejecutar jobs correctivos
+            result = self._execute_step(
+                "2.1 Ejecutar Jobs Correctivos",
+                lambda: self._ejecutar_jobs_correctivos(infocentral, acciones)
+            )
+            
+            if not result.success:
+                return (False, f"Error en jobs correctivos: {result.mensaje}",
+                        ("Jobs Correctivos", result.mensaje))
+            
+            # Actualizar cubo
+            cubosofi = CubosOfiClient()
+            result = self._execute_step(
+                "2.2 Actualizar Cubo",
+                lambda: (*cubosofi.ejecutar_job_inventario(), {})
+            )
+            
+            if not result.success:
+                return (False, f"Error actualizando cubo: {result.mensaje}",
+                        ("Actualización de Cubo", result.mensaje))
+        
+        return (True, "Rama SQL completada", None)
+    
     def _wrap_validacion(self, result: tuple) -> tuple[bool, str, dict]:
         """Convierte resultado de validar_extracto a formato (success, msg, dict)"""
         is_valid, message, last_updated = result
@@ -394,44 +479,138 @@ class ReportWorkflow:
         
         return (True, f"{len(acciones)} ubicaciones corregidas", {})
     
-    def _descargar_pdfs(self, tableau: TableauClient) -> tuple[bool, str, dict]:
-        """Descarga todos los PDFs"""
-        source_path = self.config.paths.pdf_source
+    def _iniciar_copia_pipeline(self, dest: str):
+        """
+        Arranca el hilo que copia cada PDF al share apenas termina de
+        descargarse, de modo que descarga y copia se solapan.
+
+        Cada PDF se copia con nombre temporal (.tmp): los reportes del día
+        anterior siguen publicados en el share y solo se reemplazan en el
+        paso 4, cuando todas las descargas terminaron bien. Así un fallo de
+        Tableau a mitad del paso 3 no deja el share vacío o a medias.
+
+        Returns:
+            tuple: (encolar: Callable, terminar: Callable) o (None, None) si
+                   el destino no es accesible (el paso 4 reportará el error)
+        """
+        if not os.path.exists(dest):
+            return (None, None)
+
+        cola: queue.Queue = queue.Queue()
+        copiados: list[str] = []
+        errores: list[str] = []
+
+        def _worker():
+            while True:
+                ruta = cola.get()
+                if ruta is None:
+                    break
+                nombre = os.path.basename(ruta)
+                try:
+                    shutil.copy2(ruta, os.path.join(dest, nombre + '.tmp'))
+                    copiados.append(nombre)
+                except Exception as e:
+                    errores.append(f"{ruta}: {e}")
+        
+        hilo = threading.Thread(target=_worker, daemon=True)
+        hilo.start()
+        
+        def terminar():
+            cola.put(None)
+            hilo.join()
+            return (copiados, errores)
+        
+        return (cola.put, terminar)
+    
+    def _descargar_pdfs(self, tableau: TableauClient, source_path: str,
+                        dest: str) -> tuple[bool, str, dict]:
+        """Descarga todos los PDFs, copiándolos al share en pipeline"""
         
-        # Limpiar carpeta de origen
+        # Limpiar carpeta de origen (scandir evita un stat() extra por entrada)
         if os.path.exists(source_path):
-            for f in os.listdir(source_path):
-                os.remove(os.path.join(source_path, f))
+            with os.scandir(source_path) as it:
+                for entry in it:
+                    if entry.is_file():
+                        os.unlink(entry.path)
         else:
             os.makedirs(source_path, exist_ok=True)
         
-        success, msg, archivos = tableau.descargar_todos_reportes(source_path)
+        encolar, terminar = self._iniciar_copia_pipeline(dest)
         
-        return (success, msg, {'archivos': archivos})
+        success, msg, archivos = tableau.descargar_todos_reportes(
+            source_path, on_file_ready=encolar)
+        
+        detalles = {'archivos': archivos}
+        if terminar is not None:
+            copiados, errores_copia = terminar()
+            if success:
+                detalles['copiados'] = copiados
+                detalles['errores_copia'] = errores_copia
+            else:
+                # La descarga falló: retirar los temporales del share sin
+                # tocar los PDFs del día anterior, que siguen publicados
+                self._limpiar_temporales(dest, copiados)
+
+        return (success, msg, detalles)
+
+    @staticmethod
+    def _limpiar_temporales(dest: str, nombres: list) -> None:
+        """Borra (mejor esfuerzo) los .tmp que dejó el pipeline de copia"""
+        for nombre in nombres:
+            try:
+                os.unlink(os.path.join(dest, nombre + '.tmp'))
+            except OSError:
+                pass
     
-    def _copiar_archivos(self) -> tuple[bool, str, dict]:
-        """Copia archivos de origen a destino"""
-        source = self.config.paths.pdf_source
-        dest = self.config.paths.pdf_dest
+    def _copiar_archivos(self, source: str, dest: str, copiados: list = None,
+                         errores_copia: list = None) -> tuple[bool, str, dict]:
+        """Copia archivos de origen a destino (o publica la copia en pipeline)"""
+        # El pipeline del paso 3 ya copió cada PDF (con nombre .tmp) al
+        # terminar su descarga; aquí, con todas las descargas completas,
+        # recién se retiran los reportes viejos y los temporales toman su
+        # nombre definitivo
+        if copiados is not None:
+            if errores_copia:
+                self._limpiar_temporales(dest, copiados)
+                return (False, f"Errores copiando: {'; '.join(errores_copia)}",
+                        {'archivos': copiados})
+            try:
+                with os.scandir(dest) as it:
+                    viejos = [entry.path for entry in it
+                              if entry.is_file() and not entry.name.endswith('.tmp')]
+                for ruta in viejos:
+                    os.unlink(ruta)
+                for nombre in copiados:
+                    os.replace(os.path.join(dest, nombre + '.tmp'),
+                               os.path.join(dest, nombre))
+            except Exception as e:
+                return (False, f"Error publicando archivos en {dest}: {e}",
+                        {'archivos': copiados})
+            return (True, f"{len(copiados)} archivos copiados",
+                    {'archivos': copiados})
         
         try:
             # Verificar acceso al destino
             if not os.path.exists(dest):
                 return (False, f"Carpeta destino no accesible: {dest}", {})
             
-            # Limpiar destino
-            for f in os.listdir(dest):
-                filepath = os.path.join(dest, f)
-                if os.path.isfile(filepath):
-                    os.remove(filepath)
-            
-            # Copiar archivos
-            archivos_copiados = []
-            for f in os.listdir(source):
-                src_path = os.path.join(source, f)
-                dst_path = os.path.join(dest, f)
-                shutil.copy2(src_path, dst_path)
-                archivos_copiados.append(f)
+            # Limpiar destino (scandir reutiliza el stat del dirent en is_file)
+            with os.scandir(dest) as it:
+                for entry in it:
+                    if entry.is_file():
+                        os.unlink(entry.path)
+            
+            # Copiar archivos en paralelo: sobre el share de DEADWH dominan
+            # las idas y vueltas de red, así que 4 copias a la vez las solapan
+            with os.scandir(source) as it:
+                archivos = [entry.name for entry in it if entry.is_file()]
+
+            def _copiar(nombre):
+                shutil.copy2(os.path.join(source, nombre), os.path.join(dest, nombre))
+                return nombre
+
+            with ThreadPoolExecutor(max_workers=min(4, len(archivos) or 1)) as executor:
+                archivos_copiados = list(executor.map(_copiar, archivos))
             
             return (True, f"{len(archivos_copiados)} archivos copiados", 
                     {'archivos': archivos_copiados})